@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import tempfile
+import traceback
+
+import aiohttp
+
+from cdp import AsyncCDPSession, CDPError
+from colonist_intercept import enable_async_cdp_interception, block_profile, DEFAULT_BLOCK_PROFILE
+from game_monitor import (
+    ColonistMonitor, READY_SCRIPT, READY_TIMEOUT, READY_WAIT, NO_HOOK_GRACE, GAME_NOT_FOUND_PATTERN,
+    RESET_EVENTS_SCRIPT, PROBE_SCRIPT,
+)
+from monitor_base import LoopStorage, Probe, apply_patch
+
+
+CHROMIUM_PATH = '/usr/bin/chromium'  # Adjust if necessary
+LAUNCH_TIMEOUT = 30  # seconds to wait for Chromium to open its DevTools port
+NOTIFY_BINDING = "__ctbNotify"
+
+# Calls the NOTIFY_BINDING binding after every transition the hook records. Waiters
+# are one-shot, so the callback re-registers itself each time it runs.
+NOTIFY_SCRIPT = """
+(function notify() {
+    window.__ctb.waiters.push(function () {
+        window.%s('');
+        notify();
+    });
+})();
+""" % NOTIFY_BINDING
+
+
+def _script_expression(script, args, is_async):
+    """Turn a WebDriver-style script (arguments[...], callback last if async) into an expression."""
+    args = json.dumps(list(args))
+    if is_async:
+        return ("new Promise(function (resolve) { (function () {%s\n}).apply(null, %s.concat([resolve])); })"
+                % (script, args))
+    return "(function () {%s\n}).apply(null, %s)" % (script, args)
+
+
+async def launch_chromium(arguments, user_data_dir):
+    """
+    Start Chromium with DevTools on a free port; returns (process, "host:port").
+    `arguments` are ChromeOptions arguments; chromedriver accepts them without
+    the leading "--" but Chromium would take such an argument for a URL to open.
+    """
+    arguments = [arg if arg.startswith("-") else f"--{arg}" for arg in arguments]
+    process = await asyncio.create_subprocess_exec(
+        CHROMIUM_PATH, *arguments,
+        "--remote-debugging-port=0", f"--user-data-dir={user_data_dir}", "about:blank",
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )
+    # Chromium writes the port it picked into DevToolsActivePort.
+    port_file = os.path.join(user_data_dir, "DevToolsActivePort")
+    deadline = time.time() + LAUNCH_TIMEOUT
+    while time.time() < deadline:
+        if process.returncode is not None:
+            raise RuntimeError(f"Chromium exited with code {process.returncode}")
+        try:
+            with open(port_file) as f:
+                port = f.readline().strip()
+            if port:
+                return process, f"127.0.0.1:{port}"
+        except FileNotFoundError:
+            pass
+        await asyncio.sleep(0.1)
+    process.kill()
+    raise TimeoutError(f"Chromium did not open a DevTools port within {LAUNCH_TIMEOUT}s")
+
+
+class AsyncColonistMonitor(LoopStorage, ColonistMonitor):
+    """
+    ColonistMonitor that runs on the bot's asyncio event loop instead of threads.
+
+    It launches Chromium itself and talks to it over one DevTools websocket, so
+    there is no chromedriver process and no HTTP hop per call: the game bundle
+    is patched through Fetch, scripts run with Runtime.evaluate, and the
+    injected hook wakes the monitor through a Runtime.addBinding binding
+    instead of being polled. Results are exposed the same way as
+    ColonistMonitor (state_log, end_game_state, player_names, final_results(),
+    completion_future()), and states are stored through the same code, so
+    give it a StateWriter to keep Mongo inserts off the event loop; boards are
+    written on the loop's executor.
+
+    Call `await start_driver()` and then `watch_game(game_id)` from the loop.
+    """
+
+    def __init__(self, db=None, poll_budget=None, block=DEFAULT_BLOCK_PROFILE, writer=None,
+                 keyframe_interval=None, split_board=False, headless=True):
+        super().__init__(db, poll_budget=poll_budget, block=block, writer=writer,
+                         keyframe_interval=keyframe_interval, split_board=split_board)
+        if headless:
+            self.headless()
+        self.process = None
+        self.user_data_dir = None
+        self.task = None
+        self.notified = None  # asyncio.Event set by the hook's binding
+
+    async def start_driver(self):
+        """Launch Chromium and attach the bundle interceptor and resource blocking to its tab."""
+        self.notified = asyncio.Event()
+        self.user_data_dir = tempfile.mkdtemp(prefix="colonist-chromium-")
+        try:
+            self.process, address = await launch_chromium(self.options.arguments, self.user_data_dir)
+            async with aiohttp.ClientSession() as http:
+                async with http.get(f"http://{address}/json/list") as response:
+                    targets = await response.json(content_type=None)
+            # The tab opened on the about:blank given on the command line.
+            page = next(t for t in targets if t.get("type") == "page" and t.get("url") == "about:blank")
+            self.cdp = await AsyncCDPSession.connect(page["webSocketDebuggerUrl"])
+
+            await self.cdp.send("Page.enable")
+            await self.cdp.send("Runtime.enable")
+            patterns = block_profile(self.block)["block"]
+            if patterns:
+                await self.cdp.send("Network.enable")
+                await self.cdp.send("Network.setBlockedURLs", urls=patterns)
+            await enable_async_cdp_interception(self.cdp)
+            self.cdp.on("Runtime.bindingCalled", self._on_binding)
+            await self.cdp.send("Runtime.addBinding", name=NOTIFY_BINDING)
+        except Exception:
+            await self._close_browser()
+            raise
+
+    def watch_game(self, game_id: str):
+        """Start watching a Colonist.io game in a task on the running event loop."""
+        if self.monitoring:
+            print("Already monitoring a game.")
+            return
+
+        self.game_id = game_id
+        self.monitoring = True
+        self.task = asyncio.get_running_loop().create_task(self._monitor_game())
+
+    async def _monitor_game(self):
+        try:
+            print(f'Monitoring game {self.game_id}')
+            url = f"https://colonist.io/#{self.game_id}"
+            await self.cdp.send("Page.navigate", url=url)
+            print(f'Waiting for UI Manager {self.game_id}')
+
+            self.error = await self._wait_until_ready()
+            if self.error:
+                print(f"Game not found or uiGameManager undefined ({self.error}).")
+                return
+
+            self.latest_update_time = time.time()
+            print(f'Getting initial state {self.game_id}')
+            self._reset_events(await self.execute_script(RESET_EVENTS_SCRIPT))
+            if self.hooked:
+                await self.execute_script(NOTIFY_SCRIPT)
+            else:
+                print(f"State hook missing for {self.game_id}, falling back to polling.")
+            self._record_initial(await self.probe())
+
+            print(f'Starting loop {self.game_id}')
+            while True:
+                if self.hooked:
+                    # Wake on the hook's binding, with a slow poll as a safety net.
+                    try:
+                        await asyncio.wait_for(self.notified.wait(), self.poll_policy.max_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    self.notified.clear()
+
+                probe = await self.probe()
+                changed = self._record_probe(probe)
+
+                if probe.is_game_over:
+                    self.end_game_state = probe.end_game_state
+                    if self.end_game_state is None:
+                        # endGameState is assigned slightly after isGameOver flips.
+                        await asyncio.sleep(1)
+                        self.end_game_state = (await self.probe()).end_game_state
+                    if self.end_game_state is not None:
+                        self._store_game_state("END", self.end_game_state, is_final=True)
+                    break
+
+                if time.time() - self.latest_update_time > self.max_wait_seconds:
+                    print(json.dumps({"error": "Timed out waiting for game to end."}))
+                    self.error = 'stalled'
+                    break
+
+                interval = self.poll_policy.next_interval(changed)
+                if not self.hooked:
+                    await asyncio.sleep(interval)
+
+        except Exception as exc:
+            print(json.dumps({"error": str(exc)}))
+            traceback.print_exc()
+            self.error = str(exc)
+        finally:
+            try:
+                self.poll_policy.close()
+                await self._close_browser()
+                await self._board_writes_done()
+                if self.writer is not None:
+                    # flush() blocks until the writer thread catches up.
+                    await asyncio.get_running_loop().run_in_executor(None, self.writer.flush)
+            finally:
+                self.monitoring = False
+                self._finish()
+
+    async def _wait_until_ready(self):
+        deadline = time.time() + READY_TIMEOUT
+        no_hook_since = None
+        while time.time() < deadline:
+            try:
+                status = await self.execute_async_script(READY_SCRIPT, int(READY_WAIT * 1000), GAME_NOT_FOUND_PATTERN)
+            except CDPError as e:
+                # Typically the document was replaced while the script was waiting.
+                print(f"Readiness check failed for {self.game_id}: {e}")
+                status = 'waiting'
+
+            if status == 'ready':
+                return None
+            if status in ('not_found', 'unpatched'):
+                return status
+            if status == 'no_hook':
+                no_hook_since = no_hook_since or time.time()
+                if time.time() - no_hook_since > NO_HOOK_GRACE:
+                    return status
+            if status != 'waiting':
+                await asyncio.sleep(0.25)
+        return 'timeout'
+
+    async def probe(self, wait=0):
+        result = Probe(*await self.execute_async_script(PROBE_SCRIPT, self.state_hash, int(wait * 1000)))
+        if result.patch is not None:
+            self.game_state = apply_patch(self.game_state, result.patch)
+            self.state_hash = result.state_hash
+        return result
+
+    async def execute_script(self, script, *args):
+        return await self._evaluate(_script_expression(script, args, is_async=False))
+
+    async def execute_async_script(self, script, *args):
+        return await self._evaluate(_script_expression(script, args, is_async=True))
+
+    async def _evaluate(self, expression):
+        result = await self.cdp.send("Runtime.evaluate", expression=expression,
+                                     awaitPromise=True, returnByValue=True)
+        if "exceptionDetails" in result:
+            details = result["exceptionDetails"]
+            raise CDPError(details.get("exception", {}).get("description") or details.get("text"))
+        return result["result"].get("value")
+
+    def _on_binding(self, params):
+        if params.get("name") == NOTIFY_BINDING:
+            self.notified.set()
+
+    async def _close_browser(self):
+        if self.cdp is not None:
+            await self.cdp.close()
+        if self.process is not None and self.process.returncode is None:
+            self.process.terminate()
+            try:
+                await asyncio.wait_for(self.process.wait(), 10)
+            except asyncio.TimeoutError:
+                self.process.kill()
+        if self.user_data_dir:
+            shutil.rmtree(self.user_data_dir, ignore_errors=True)
+            self.user_data_dir = None
+
+
+async def _main():
+    if len(sys.argv) < 2:
+        print("Usage: python async_monitor.py <gameId>")
+        sys.exit(1)
+
+    monitor = AsyncColonistMonitor()
+    await monitor.start_driver()
+    monitor.watch_game(sys.argv[1])
+    await monitor.completion_future(asyncio.get_running_loop())
+
+    results = monitor.final_results()
+    if results:
+        print("Final results:", {name: vps for name, vps, _ in results})
+    else:
+        print("No final end_game_state found or monitoring timed out.")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+import time
+import threading
+import traceback
+from collections import deque
+from contextlib import contextmanager
+
+from seleniumwire.webdriver import Chrome, ChromeOptions
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service as ChromeService
+
+from cdp import connect_to_window
+from colonist_intercept import (
+    expose_game_data, serve_cached_bundle, enable_cdp_interception,
+    block_profile, apply_block_profile, DEFAULT_BLOCK_PROFILE,
+)
+
+
+CHROMEDRIVER_PATH = '/usr/bin/chromedriver'  # Adjust if necessary
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:128.0) Gecko/20100101 Firefox/128.0"
+PRELOAD_URL = "https://colonist.io/"  # Loading the lobby pulls the main web.[hash].js bundle
+PRELOAD_TIMEOUT = 30  # seconds to wait for a warming tab to finish loading
+MAINTAIN_INTERVAL = 5  # seconds between background refill / eviction passes
+WARM_CHECK_SCRIPT = 'return location.href.indexOf(arguments[0]) === 0 && document.readyState === "complete";'
+
+# How the colonist bundle gets patched:
+#   "proxy" - selenium-wire's MITM proxy rewrites the response (all traffic goes through it)
+#   "cdp"   - Chrome DevTools Fetch interception pauses only the bundle request
+INTERCEPTION_BACKENDS = ("proxy", "cdp")
+
+NEW_BROWSER = object()  # _pick_browser() result: start another browser
+WAIT_FOR_BROWSER = object()  # _pick_browser() result: wait for a browser that is starting
+
+
+def build_options(headless=False, block=DEFAULT_BLOCK_PROFILE):
+    """Return the ChromeOptions every monitored browser starts with."""
+    options = ChromeOptions()
+    # Example user-agent override (optional):
+    options.add_argument(f"--user-agent={USER_AGENT}")
+    # Tabs that are not in the foreground must keep running the game at full speed.
+    options.add_argument("--disable-background-timer-throttling")
+    options.add_argument("--disable-backgrounding-occluded-windows")
+    options.add_argument("--disable-renderer-backgrounding")
+    for arg in block_profile(block)["chrome_args"]:
+        options.add_argument(arg)
+    if headless:
+        add_headless_arguments(options)
+    return options
+
+
+def add_headless_arguments(options):
+    options.add_argument("--headless")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-gpu")
+
+
+def create_driver(options, interception="proxy"):
+    """
+    Start a Chrome driver for the given interception backend. With "proxy" this is
+    a Selenium Wire driver with the colonist response interceptor attached; with
+    "cdp" it is a plain driver and each window needs attach_interceptor().
+    """
+    if interception not in INTERCEPTION_BACKENDS:
+        raise ValueError(f"Unknown interception backend: {interception}")
+
+    service = ChromeService(executable_path=CHROMEDRIVER_PATH)
+
+    if interception == "cdp":
+        return webdriver.Chrome(service=service, options=options)
+
+    driver = Chrome(
+        service=service,
+        options=options
+    )
+    # Restrict interception to colonist .js resources:
+    driver.scopes = [r'.*colonist\.io.*\.js(\?.*)?$']
+    driver.request_interceptor = serve_cached_bundle
+    driver.response_interceptor = expose_game_data
+    return driver
+
+
+def attach_interceptor(driver, handle, interception="proxy", block=DEFAULT_BLOCK_PROFILE):
+    """
+    Install per-window interception and the request block profile; `handle` must
+    be the current window. Returns the CDPSession for the "cdp" backend (the caller
+    closes it with the window) and None for "proxy", whose bundle rewriting is
+    already active for the whole driver.
+    """
+    if interception != "cdp":
+        apply_block_profile(driver, block)
+        return None
+    session = connect_to_window(driver, handle)
+    try:
+        apply_block_profile(driver, block, session)
+        enable_cdp_interception(session)
+    except Exception:
+        session.close()
+        raise
+    return session
+
+
+class BrowserTab:
+    """
+    One tab inside a pooled Chromium process.
+
+    Exposes the part of the WebDriver API that ColonistMonitor uses. A WebDriver
+    session only has one active window, so every call switches to this tab while
+    holding the owning browser's lock.
+    """
+
+    def __init__(self, browser, handle):
+        self.browser = browser
+        self.handle = handle
+        self.warmed_at = None
+
+    def get(self, url):
+        with self.browser.focus(self.handle) as driver:
+            driver.get(url)
+
+    def execute_script(self, script, *args):
+        with self.browser.focus(self.handle) as driver:
+            return driver.execute_script(script, *args)
+
+    def execute_async_script(self, script, *args):
+        with self.browser.focus(self.handle) as driver:
+            return driver.execute_async_script(script, *args)
+
+    @property
+    def cdp_session(self):
+        """The tab's CDPSession with the "cdp" backend, otherwise None."""
+        return self.browser.sessions.get(self.handle)
+
+    def quit(self):
+        """Hand the tab back to the pool; the browser itself keeps running."""
+        self.browser.pool.release(self)
+
+
+class PooledBrowser:
+    """A Chromium process owned by a BrowserPool, hosting several tabs."""
+
+    def __init__(self, pool, driver, interception="proxy", block=DEFAULT_BLOCK_PROFILE):
+        self.pool = pool
+        self.driver = driver
+        self.interception = interception
+        self.block = block
+        self.sessions = {}  # handle -> CDPSession, for the "cdp" backend
+        self.lock = threading.RLock()
+        # The initial window is never leased, so closing the last game tab
+        # does not end the WebDriver session.
+        self.home_handle = driver.current_window_handle
+        self.current_handle = self.home_handle
+        self.tabs = set()
+        self.broken = False
+        self.idle_since = None
+
+    @contextmanager
+    def focus(self, handle):
+        with self.lock:
+            if self.current_handle != handle:
+                self.driver.switch_to.window(handle)
+                self.current_handle = handle
+            yield self.driver
+
+    def open_tab(self):
+        with self.lock:
+            self.driver.switch_to.new_window('tab')
+            handle = self.driver.current_window_handle
+            self.current_handle = handle
+            self.tabs.add(handle)
+            self.idle_since = None
+            try:
+                session = attach_interceptor(self.driver, handle, self.interception, self.block)
+            except Exception:
+                self.close_tab(BrowserTab(self, handle))
+                raise
+            if session is not None:
+                self.sessions[handle] = session
+        return BrowserTab(self, handle)
+
+    def close_tab(self, tab):
+        with self.lock:
+            self.tabs.discard(tab.handle)
+            if not self.tabs:
+                self.idle_since = time.time()
+            session = self.sessions.pop(tab.handle, None)
+            if session is not None:
+                session.close()
+            try:
+                with self.focus(tab.handle) as driver:
+                    driver.close()
+            finally:
+                self.driver.switch_to.window(self.home_handle)
+                self.current_handle = self.home_handle
+
+    def quit(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+            try:
+                self.driver.quit()
+            except Exception as e:
+                print(f"Failed to quit pooled browser: {e}")
+
+
+class BrowserPool:
+    """
+    Hosts game tabs inside a small, fixed number of Chromium processes.
+
+    Monitors lease a tab with `lease()` and give it back with `release()`
+    (or `tab.quit()`), so memory grows with the number of games rather than
+    with the number of browsers.
+
+    Once `start()` is called, a background thread keeps between `warm_low` and
+    `warm_high` idle tabs that have already loaded colonist.io through the
+    interceptor, so a lease is usually just a tab navigation. Warm tabs above
+    the low watermark and empty browsers are evicted after `idle_timeout`.
+
+    Browsers are never shared between interception backends; `max_browsers`
+    applies to each backend separately.
+    """
+
+    def __init__(self, max_browsers=2, tabs_per_browser=8, headless=True,
+                 warm_low=2, warm_high=4, idle_timeout=600, preload_url=PRELOAD_URL,
+                 interception="proxy", block=DEFAULT_BLOCK_PROFILE):
+        self.max_browsers = max_browsers
+        self.tabs_per_browser = tabs_per_browser
+        self.headless = headless
+        self.interception = interception
+        block_profile(block)  # fail at startup on an unknown or unsafe profile
+        self.block = block
+        self.warm_low = warm_low
+        self.warm_high = warm_high
+        self.idle_timeout = idle_timeout
+        self.preload_url = preload_url
+
+        self.browsers = []
+        self.starting = {}  # interception backend -> browsers being started outside the lock
+        self.warm_tabs = deque()  # oldest warmed first
+        self.lock = threading.Lock()
+        self.browser_started = threading.Condition(self.lock)  # notified when a start finishes
+        self.stats = {"warm_leases": 0, "cold_leases": 0, "evicted_tabs": 0, "evicted_browsers": 0}
+
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._maintainer = None
+
+    def start(self):
+        """Start the background thread that refills and evicts warm tabs."""
+        if self._maintainer is None:
+            self._maintainer = threading.Thread(target=self._maintain, daemon=True)
+            self._maintainer.start()
+
+    def lease(self, interception=None):
+        """
+        Return a warm tab if one is ready, otherwise open a new tab in the least
+        loaded browser, starting a browser if there is room.
+
+        :param interception: backend for this tab, defaults to the pool's. Warm
+            tabs are only kept for the pool's default backend.
+        """
+        interception = interception or self.interception
+        tab = None
+        if interception == self.interception:
+            with self.lock:
+                tab = self.warm_tabs.pop() if self.warm_tabs else None
+        if tab is not None:
+            self.stats["warm_leases"] += 1
+        else:
+            tab = self._open_tab(interception=interception)
+            self.stats["cold_leases"] += 1
+        self._wake.set()
+        print(f"Leased tab {tab.handle} ({self.tab_count()} tabs in {len(self.browsers)} browsers)")
+        return tab
+
+    def release(self, tab):
+        browser = tab.browser
+        try:
+            browser.close_tab(tab)
+        except Exception as e:
+            # A tab that cannot be closed usually means Chromium or chromedriver died.
+            print(f"Failed to close tab {tab.handle}, discarding its browser: {e}")
+            traceback.print_exc()
+            browser.broken = True
+
+        with self.lock:
+            if browser.broken and browser in self.browsers:
+                self.browsers.remove(browser)
+                # Warm tabs of a dead browser are useless too.
+                self.warm_tabs = deque(t for t in self.warm_tabs if t.browser is not browser)
+            else:
+                browser = None
+        if browser is not None:
+            browser.quit()
+
+    def tab_count(self):
+        return sum(len(b.tabs) for b in self.browsers)
+
+    def shutdown(self):
+        self._stopped.set()
+        self._wake.set()
+        with self.lock:
+            browsers, self.browsers = self.browsers, []
+            self.warm_tabs.clear()
+        for browser in browsers:
+            browser.quit()
+
+    def _open_tab(self, overcommit=True, interception=None):
+        interception = interception or self.interception
+        with self.lock:
+            browser = self._pick_browser(overcommit, interception)
+            while browser is WAIT_FOR_BROWSER:
+                self.browser_started.wait()
+                browser = self._pick_browser(overcommit, interception)
+            if browser is None:
+                return None
+            if browser is not NEW_BROWSER:
+                # Opened under the pool lock so two leases cannot overfill a browser.
+                return browser.open_tab()
+            # Reserve the browser slot; Chromium is started outside the lock so
+            # releases and warm leases are not held up by the cold start.
+            self.starting[interception] = self.starting.get(interception, 0) + 1
+        try:
+            browser = self._start_browser(interception)
+        except Exception:
+            with self.lock:
+                self.starting[interception] -= 1
+                self.browser_started.notify_all()
+            raise
+        with self.lock:
+            self.starting[interception] -= 1
+            self.browser_started.notify_all()
+            if self._stopped.is_set():
+                browser.quit()
+                raise RuntimeError("Browser pool was shut down")
+            self.browsers.append(browser)
+            return browser.open_tab()
+
+    def _start_browser(self, interception):
+        options = build_options(self.headless, self.block)
+        # Don't let navigations block the other tabs sharing this session.
+        options.page_load_strategy = 'none'
+        return PooledBrowser(self, create_driver(options, interception), interception, self.block)
+
+    def _pick_browser(self, overcommit, interception):
+        """
+        Return the browser to open a tab in, NEW_BROWSER if a browser should be
+        started for it, WAIT_FOR_BROWSER if the pool is full but a browser is
+        still starting, or None if there is no room and `overcommit` is off.
+        """
+        candidates = [b for b in self.browsers if not b.broken and b.interception == interception]
+        free = [b for b in candidates if len(b.tabs) < self.tabs_per_browser]
+        if free:
+            return min(free, key=lambda b: len(b.tabs))
+
+        starting = self.starting.get(interception, 0)
+        if len(candidates) + starting < self.max_browsers or (overcommit and not candidates and not starting):
+            return NEW_BROWSER
+
+        if not overcommit:
+            return None
+        if starting:
+            return WAIT_FOR_BROWSER
+        # Every browser is full; overcommit rather than refuse to watch a game.
+        print("All pooled browsers are full, overcommitting the least loaded one.")
+        return min(candidates, key=lambda b: len(b.tabs))
+
+    def _maintain(self):
+        while not self._stopped.is_set():
+            self._wake.wait(MAINTAIN_INTERVAL)
+            self._wake.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                self._refill()
+                self._evict_idle()
+            except Exception as e:
+                print(f"Browser pool maintenance error: {e}")
+                traceback.print_exc()
+
+    def _refill(self):
+        if len(self.warm_tabs) >= self.warm_low:
+            return
+        while len(self.warm_tabs) < self.warm_high and not self._stopped.is_set():
+            tab = self._open_tab(overcommit=False)
+            if tab is None:
+                return  # Pool is at capacity, don't take room from real games
+            try:
+                self._warm(tab)
+            except Exception as e:
+                print(f"Failed to warm tab {tab.handle}: {e}")
+                self.release(tab)
+                return
+            with self.lock:
+                self.warm_tabs.append(tab)
+
+    def _warm(self, tab):
+        """Load colonist.io once so the patched bundle sits in the browser cache."""
+        tab.get(self.preload_url)
+        deadline = time.time() + PRELOAD_TIMEOUT
+        # With the 'none' load strategy get() returns before the navigation
+        # commits, so readyState may still belong to the old about:blank page.
+        while not tab.execute_script(WARM_CHECK_SCRIPT, self.preload_url):
+            if time.time() > deadline:
+                raise TimeoutError(f"{self.preload_url} did not finish loading")
+            time.sleep(0.5)
+        # Park the tab so the lobby doesn't keep running in the background.
+        tab.get("about:blank")
+        tab.warmed_at = time.time()
+
+    def _evict_idle(self):
+        cutoff = time.time() - self.idle_timeout
+        expired_tabs = []
+        expired_browsers = []
+        with self.lock:
+            while len(self.warm_tabs) > self.warm_low and self.warm_tabs[0].warmed_at < cutoff:
+                expired_tabs.append(self.warm_tabs.popleft())
+        for tab in expired_tabs:
+            self.release(tab)
+            self.stats["evicted_tabs"] += 1
+
+        with self.lock:
+            for browser in list(self.browsers):
+                if not browser.tabs and browser.idle_since and browser.idle_since < cutoff:
+                    self.browsers.remove(browser)
+                    expired_browsers.append(browser)
+        for browser in expired_browsers:
+            browser.quit()
+            self.stats["evicted_browsers"] += 1
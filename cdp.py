@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+import json
+import queue
+import asyncio
+import itertools
+import threading
+import traceback
+import urllib.request
+
+import aiohttp
+import websocket
+
+
+class CDPError(Exception):
+    """An error response to a Chrome DevTools Protocol command."""
+
+
+class CDPSession:
+    """
+    Minimal synchronous Chrome DevTools Protocol client for a single target.
+
+    A reader thread matches command responses to `send()` calls, and a separate
+    dispatcher thread runs event handlers, so a handler may itself call `send()`.
+    """
+
+    def __init__(self, ws_url, timeout=30):
+        self.timeout = timeout
+        # Chrome rejects DevTools websockets with an unexpected Origin header.
+        self.ws = websocket.create_connection(ws_url, timeout=None, suppress_origin=True)
+        self.ids = itertools.count(1)
+        self.pending = {}  # command id -> [threading.Event, response]
+        self.handlers = {}  # event method -> [callback(params)]
+        self.events = queue.Queue()
+        self.lock = threading.Lock()
+        self.closed = False
+
+        threading.Thread(target=self._read_loop, daemon=True).start()
+        threading.Thread(target=self._dispatch_loop, daemon=True).start()
+
+    def send(self, method, **params):
+        """Send a command and block until Chrome answers it."""
+        waiter = [threading.Event(), None]
+        with self.lock:
+            if self.closed:
+                raise CDPError(f"{method}: session is closed")
+            command_id = next(self.ids)
+            self.pending[command_id] = waiter
+            self.ws.send(json.dumps({"id": command_id, "method": method, "params": params}))
+
+        if not waiter[0].wait(self.timeout):
+            with self.lock:
+                self.pending.pop(command_id, None)
+            raise TimeoutError(f"{method}: no response after {self.timeout}s")
+        response = waiter[1]
+        if "error" in response:
+            raise CDPError(f"{method}: {response['error'].get('message')}")
+        return response.get("result", {})
+
+    def on(self, method, callback):
+        """Call `callback(params)` for every `method` event from this target."""
+        self.handlers.setdefault(method, []).append(callback)
+
+    def off(self, method, callback):
+        """Stop calling a callback registered with `on()`."""
+        callbacks = self.handlers.get(method, [])
+        if callback in callbacks:
+            self.handlers[method] = [c for c in callbacks if c != callback]
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            pending, self.pending = self.pending, {}
+        for waiter in pending.values():
+            waiter[1] = {"error": {"message": "session closed"}}
+            waiter[0].set()
+        self.events.put(None)
+        try:
+            self.ws.close()
+        except Exception:
+            pass
+
+    def _read_loop(self):
+        try:
+            while not self.closed:
+                message = json.loads(self.ws.recv())
+                if "id" in message:
+                    with self.lock:
+                        waiter = self.pending.pop(message["id"], None)
+                    if waiter is not None:
+                        waiter[1] = message
+                        waiter[0].set()
+                elif "method" in message:
+                    self.events.put(message)
+        except Exception as e:
+            if not self.closed:
+                print(f"CDP connection lost: {e}")
+        finally:
+            self.close()
+
+    def _dispatch_loop(self):
+        while True:
+            message = self.events.get()
+            if message is None:
+                return
+            for callback in self.handlers.get(message["method"], []):
+                try:
+                    callback(message.get("params", {}))
+                except Exception as e:
+                    print(f"CDP handler error for {message['method']}: {e}")
+                    traceback.print_exc()
+
+
+class AsyncCDPSession:
+    """
+    Chrome DevTools Protocol client for a single target that runs entirely on
+    an asyncio event loop (aiohttp websocket, no threads).
+
+    Event handlers may be plain functions or coroutine functions; coroutines
+    are started as tasks so a handler can itself await `send()`.
+    """
+
+    def __init__(self, http, ws, timeout=30):
+        self.http = http
+        self.ws = ws
+        self.timeout = timeout
+        self.ids = itertools.count(1)
+        self.pending = {}  # command id -> Future
+        self.handlers = {}  # event method -> [callback(params)]
+        self.tasks = set()
+        self.closed = False
+        self.reader = asyncio.get_running_loop().create_task(self._read_loop())
+
+    @classmethod
+    async def connect(cls, ws_url, timeout=30):
+        http = aiohttp.ClientSession()
+        try:
+            # Results such as whole game states can be large, so no message size limit.
+            ws = await http.ws_connect(ws_url, max_msg_size=0)
+        except Exception:
+            await http.close()
+            raise
+        return cls(http, ws, timeout)
+
+    async def send(self, method, **params):
+        """Send a command and wait for Chrome's answer."""
+        if self.closed:
+            raise CDPError(f"{method}: session is closed")
+        command_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[command_id] = future
+        try:
+            await self.ws.send_str(json.dumps({"id": command_id, "method": method, "params": params}))
+            response = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"{method}: no response after {self.timeout}s")
+        finally:
+            self.pending.pop(command_id, None)
+        if "error" in response:
+            raise CDPError(f"{method}: {response['error'].get('message')}")
+        return response.get("result", {})
+
+    def on(self, method, callback):
+        """Call `callback(params)` for every `method` event from this target."""
+        self.handlers.setdefault(method, []).append(callback)
+
+    async def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for future in self.pending.values():
+            if not future.done():
+                future.set_result({"error": {"message": "session closed"}})
+        self.pending = {}
+        await self.ws.close()
+        await self.http.close()
+
+    async def _read_loop(self):
+        try:
+            async for message in self.ws:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    break
+                message = json.loads(message.data)
+                if "id" in message:
+                    future = self.pending.get(message["id"])
+                    if future is not None and not future.done():
+                        future.set_result(message)
+                elif "method" in message:
+                    self._dispatch(message)
+        except Exception as e:
+            if not self.closed:
+                print(f"CDP connection lost: {e}")
+        finally:
+            if not self.closed:
+                await self.close()
+
+    def _dispatch(self, message):
+        for callback in self.handlers.get(message["method"], []):
+            try:
+                result = callback(message.get("params", {}))
+                if asyncio.iscoroutine(result):
+                    task = asyncio.get_running_loop().create_task(result)
+                    self.tasks.add(task)
+                    task.add_done_callback(self._handler_done)
+            except Exception as e:
+                print(f"CDP handler error for {message['method']}: {e}")
+                traceback.print_exc()
+
+    def _handler_done(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"CDP handler error: {task.exception()}")
+
+
+def debugger_address(driver):
+    """Return the host:port chromedriver's browser exposes DevTools on."""
+    return driver.capabilities["goog:chromeOptions"]["debuggerAddress"]
+
+
+def connect_to_window(driver, handle):
+    """Open a CDPSession to the page target behind a WebDriver window handle."""
+    # chromedriver window handles are DevTools target ids (older versions add a prefix).
+    target_id = handle.replace("CDwindow-", "")
+    with urllib.request.urlopen(f"http://{debugger_address(driver)}/json") as response:
+        targets = json.loads(response.read().decode("utf-8"))
+    for target in targets:
+        if target.get("id", "").upper() == target_id.upper():
+            return CDPSession(target["webSocketDebuggerUrl"])
+    raise CDPError(f"No DevTools target for window {handle}")
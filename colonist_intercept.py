@@ -1,51 +1,515 @@
 from seleniumwire.utils import decode
 
+import os
 import sys
 import re
+import asyncio
+import base64
+import hashlib
+import json
+import tempfile
+import threading
 import traceback
 
 
+# Page-side hook prepended to the bundle. Once `uiGameManager` is assigned it wraps
+# `gameController.currentState` with an accessor that records every transition, tagged
+# with a sequence number, into a ring buffer of the last RING_CAPACITY transitions. The
+# monitor drains the whole buffer in one call with `drain()` or long-polls with
+# `wait(timeoutMs, callback)`; a jump in sequence numbers means the buffer overflowed
+# between drains. `window.__ctb.ready` resolves once the hook is attached.
+RING_CAPACITY = 1024
+HOOK_PRELUDE = """
+(function () {
+    if (window.__ctb) return;
+    var CAPACITY = %d;
+    var ctb = window.__ctb = {
+        ring: new Array(CAPACITY), start: 0, count: 0, seq: 0, dropped: 0,
+        waiters: [], manager: null, controller: null
+    };
+    var resolveReady;
+    ctb.ready = new Promise(function (resolve) { resolveReady = resolve; });
+
+    function snapshot(state) {
+        // A copy, so later in-place edits of the live object do not rewrite buffered history.
+        try {
+            return state === undefined ? state : JSON.parse(JSON.stringify(state));
+        } catch (e) {
+            return state;
+        }
+    }
+
+    function record(state) {
+        var event = {seq: ++ctb.seq, state: snapshot(state), t: Date.now()};
+        if (ctb.count === CAPACITY) {
+            // Full: overwrite the oldest transition.
+            ctb.ring[ctb.start] = event;
+            ctb.start = (ctb.start + 1) %% CAPACITY;
+            ctb.dropped++;
+        } else {
+            ctb.ring[(ctb.start + ctb.count) %% CAPACITY] = event;
+            ctb.count++;
+        }
+        var waiters = ctb.waiters;
+        ctb.waiters = [];
+        for (var i = 0; i < waiters.length; i++) waiters[i]();
+    }
+
+    function findDescriptor(obj, key) {
+        for (var o = obj; o; o = Object.getPrototypeOf(o)) {
+            var d = Object.getOwnPropertyDescriptor(o, key);
+            if (d) return d;
+        }
+        return null;
+    }
+
+    function hook(gc) {
+        var d = findDescriptor(gc, 'currentState');
+        var read, write, value;
+        if (d && (d.get || d.set)) {
+            read = function () { return d.get ? d.get.call(gc) : undefined; };
+            write = function (v) { if (d.set) d.set.call(gc, v); };
+        } else {
+            value = gc.currentState;
+            read = function () { return value; };
+            write = function (v) { value = v; };
+        }
+        Object.defineProperty(gc, 'currentState', {
+            configurable: true,
+            enumerable: true,
+            get: read,
+            set: function (v) {
+                var prev = read();
+                write(v);
+                var curr = read();
+                if (curr !== prev) record(curr);
+            }
+        });
+        ctb.controller = gc;
+        record(read());
+        resolveReady(true);
+    }
+
+    function ensureHooked() {
+        var gc = ctb.manager && ctb.manager.gameController;
+        if (gc && gc !== ctb.controller) hook(gc);
+        return !!gc;
+    }
+
+    ctb.attach = function (manager) {
+        ctb.manager = manager;
+        (function retry() {
+            if (!ensureHooked()) setTimeout(retry, 50);
+        })();
+    };
+
+    ctb.drain = function () {
+        ensureHooked();
+        var events = new Array(ctb.count);
+        for (var i = 0; i < ctb.count; i++) {
+            events[i] = ctb.ring[(ctb.start + i) %% CAPACITY];
+            ctb.ring[(ctb.start + i) %% CAPACITY] = undefined;
+        }
+        ctb.start = 0;
+        ctb.count = 0;
+        return events;
+    };
+
+    ctb.wait = function (timeoutMs, callback) {
+        ensureHooked();
+        if (ctb.count || timeoutMs <= 0) {
+            callback(ctb.drain());
+            return;
+        }
+        var done = false;
+        function finish() {
+            if (done) return;
+            done = true;
+            callback(ctb.drain());
+        }
+        ctb.waiters.push(finish);
+        setTimeout(finish, timeoutMs);
+    };
+})();
+""" % RING_CAPACITY
+
+# A "use strict" directive only counts as the first statement, so the prelude goes after it.
+STRICT_DIRECTIVE = re.compile(r'^(?:\s|/\*[\s\S]*?\*/|//[^\n]*\n)*(["\'])use strict\1;?')
+
+
+def _prepend_prelude(body_str, prelude):
+    match = STRICT_DIRECTIVE.match(body_str)
+    split = match.end() if match else 0
+    return body_str[:split] + prelude + body_str[split:]
+
+
+# Only the main colonist dist script (web.xxxxx.js) is rewritten; the hash in its
+# filename identifies the content.
+GAME_BUNDLE_PATTERN = re.compile(r'/web\.([0-9a-z]+)\.(js|js\?.*)$')
+# Fetch.enable pattern for the CDP backend; matches are re-checked with is_game_bundle().
+CDP_BUNDLE_PATTERN = "*colonist.io/dist/web.*.js*"
+
+# (marker, original, replacement) triples applied once each to the bundle source.
+# Which markers were found is published to the page as `window.__ctbPatch`.
+BUNDLE_REPLACEMENTS = [
+    ("uiGameManager",
+     "this.forceHideAds=!1,this.uiGameManager=e,",
+     "this.forceHideAds=1,window.uiGameManager=e,window.__ctb&&window.__ctb.attach(e),this.uiGameManager=e,"),
+    ("endGameState",
+     "this.endGameState=t,this.isReplayAvailable=i,",
+     "this.endGameState=t,this.isReplayAvailable=i,window.endGameState=t,"),
+]
+
+# Patched bundles are cached in memory and on disk, keyed by bundle hash plus a
+# fingerprint of the patch itself so editing the patch never serves stale bundles.
+BUNDLE_CACHE_DIR = os.environ.get("BUNDLE_CACHE_DIR", "bundle_cache")
+PATCH_FINGERPRINT = hashlib.sha1(
+    (HOOK_PRELUDE + repr(BUNDLE_REPLACEMENTS)).encode('utf-8')
+).hexdigest()[:12]
+BUNDLE_HEADERS = {"Content-Type": "application/javascript; charset=utf-8"}
+
+_bundle_cache = {}  # bundle hash -> patched bytes
+_bundle_locks = {}  # bundle hash -> Lock, so each new bundle is patched only once
+_bundle_cache_lock = threading.Lock()
+
+
+# Requests the monitor never needs, in Network.setBlockedURLs wildcard syntax.
+AD_AND_ANALYTICS_PATTERNS = [
+    "*doubleclick.net*", "*googlesyndication.com*", "*googletagmanager.com*",
+    "*google-analytics.com*", "*adservice.google.*", "*amazon-adsystem.com*",
+    "*adnxs.com*", "*nitropay.com*", "*adinplay.com*", "*facebook.net*",
+    "*hotjar.com*", "*clarity.ms*", "*cloudflareinsights.com*",
+]
+AUDIO_EXTENSIONS = ["mp3", "ogg", "wav", "m4a", "aac"]
+FONT_EXTENSIONS = ["woff", "woff2", "ttf", "otf"]
+IMAGE_EXTENSIONS = ["png", "jpg", "jpeg", "gif", "webp", "avif"]
+
+
+def _extension_patterns(extensions):
+    # Anchored at the end of the path (optionally followed by a query), so that
+    # e.g. "aac" does not match a bundle named web.aac0ff....js.
+    return [p for ext in extensions for p in (f"*.{ext}", f"*.{ext}?*")]
+
+
+AUDIO_PATTERNS = _extension_patterns(AUDIO_EXTENSIONS)
+FONT_PATTERNS = _extension_patterns(FONT_EXTENSIONS)
+IMAGE_PATTERNS = _extension_patterns(IMAGE_EXTENSIONS)
+
+# "safe" leaves images alone because the game's asset loading may wait on them
+# before it creates uiGameManager; "lean" also blocks and stops decoding images.
+BLOCK_PROFILES = {
+    "off": {"block": [], "chrome_args": []},
+    "safe": {
+        "block": AD_AND_ANALYTICS_PATTERNS + AUDIO_PATTERNS + FONT_PATTERNS,
+        "chrome_args": ["--mute-audio"],
+    },
+    "lean": {
+        "block": AD_AND_ANALYTICS_PATTERNS + AUDIO_PATTERNS + FONT_PATTERNS + IMAGE_PATTERNS,
+        "chrome_args": ["--mute-audio", "--blink-settings=imagesEnabled=false"],
+    },
+}
+DEFAULT_BLOCK_PROFILE = "safe"
+
+# Requests the game hooks depend on; no block profile may match them.
+REQUIRED_URLS = [
+    "https://colonist.io/",
+    "https://colonist.io/#gameId",
+    "https://colonist.io/dist/web.0123456789abcdef.js",
+    "https://colonist.io/dist/web.0123456789abcdef.js?v=1",
+    "wss://socket.colonist.io/",
+] + [
+    # Bundle hashes are hex, and a hash may start with a blocked extension.
+    f"https://colonist.io/dist/web.{ext}0123456789.js{query}"
+    for ext in AUDIO_EXTENSIONS + FONT_EXTENSIONS + IMAGE_EXTENSIONS
+    for query in ("", "?v=1")
+]
+
+
+def _blocked_url_matches(pattern, url):
+    # Chrome's blocked URL patterns only support '*'; '?' and the rest are literal.
+    return re.fullmatch(".*".join(map(re.escape, pattern.split("*"))), url, re.DOTALL) is not None
+
+
+def block_profile(name):
+    """
+    Return the named entry of BLOCK_PROFILES after checking that none of its
+    patterns would block a request in REQUIRED_URLS.
+    """
+    if name not in BLOCK_PROFILES:
+        raise ValueError(f"Unknown block profile: {name}")
+    profile = BLOCK_PROFILES[name]
+    for pattern in profile["block"]:
+        for url in REQUIRED_URLS:
+            if _blocked_url_matches(pattern, url):
+                raise ValueError(f"Block profile {name!r} pattern {pattern!r} would block {url}")
+    return profile
+
+
+def apply_block_profile(driver, name, session=None):
+    """
+    Abort the profile's requests in the current window, through the CDP session
+    of the "cdp" backend when there is one, otherwise through chromedriver.
+    """
+    patterns = block_profile(name)["block"]
+    if not patterns:
+        return
+    if session is not None:
+        session.send("Network.enable")
+        session.send("Network.setBlockedURLs", urls=patterns)
+    else:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+
+
+def is_game_bundle(url):
+    return "colonist.io/dist/" in url and GAME_BUNDLE_PATTERN.search(url) is not None
+
+
+def bundle_hash(url):
+    match = GAME_BUNDLE_PATTERN.search(url)
+    return match.group(1) if match else None
+
+
+def patch_bundle(body_str):
+    """Return the bundle source with our window references and hook injected."""
+    new_body_str = body_str
+    applied = {}
+    for marker, original, replacement in BUNDLE_REPLACEMENTS:
+        applied[marker] = original in new_body_str
+        if not applied[marker]:
+            print(f"Bundle patch marker {marker!r} not found, Colonist may have changed.", file=sys.stderr)
+        new_body_str = new_body_str.replace(original, replacement, 1)  # replace only the first match
+    prelude = f"window.__ctbPatch={json.dumps(applied)};" + HOOK_PRELUDE
+    return _prepend_prelude(new_body_str, prelude)
+
+
+def _bundle_cache_path(key):
+    return os.path.join(BUNDLE_CACHE_DIR, f"web.{key}.{PATCH_FINGERPRINT}.js")
+
+
+def cached_bundle(url):
+    """Return the already patched bundle for `url` from memory or disk, or None."""
+    key = bundle_hash(url)
+    if key is None:
+        return None
+    body = _bundle_cache.get(key)
+    if body is not None:
+        return body
+    try:
+        with open(_bundle_cache_path(key), 'rb') as f:
+            body = f.read()
+    except OSError:
+        return None
+    _bundle_cache[key] = body
+    return body
+
+
+def patched_bundle(url, load_body):
+    """
+    Return the patched bundle for `url`, serving it from the cache when possible.
+    On a miss `load_body()` must return the original source as a str; it is
+    patched once, even if several monitors miss at the same time.
+    """
+    key = bundle_hash(url)
+    with _bundle_cache_lock:
+        lock = _bundle_locks.setdefault(key, threading.Lock())
+    with lock:
+        body = cached_bundle(url)
+        if body is not None:
+            return body
+
+        body_str = load_body()
+        body = patch_bundle(body_str).encode('utf-8')
+        print('JS Intercepted...')
+        print(len(body_str))
+        print(len(body))
+        _bundle_cache[key] = body
+        try:
+            os.makedirs(BUNDLE_CACHE_DIR, exist_ok=True)
+            # A unique temp name, since worker processes may patch the same bundle at once.
+            fd, tmp_path = tempfile.mkstemp(prefix=f"web.{key}.", suffix=".tmp", dir=BUNDLE_CACHE_DIR)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(body)
+                os.replace(tmp_path, _bundle_cache_path(key))
+            except OSError:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            print(f"Could not write bundle cache for {key}: {e}", file=sys.stderr)
+        return body
+
+
+def serve_cached_bundle(request):
+    """
+    Selenium Wire request interceptor: answer requests for an already patched
+    bundle from the cache without going to the network.
+    """
+    try:
+        if is_game_bundle(request.url):
+            body = cached_bundle(request.url)
+            if body is not None:
+                request.create_response(status_code=200, headers=BUNDLE_HEADERS, body=body)
+    except Exception as e:
+        print(f"Interceptor error: {e}", file=sys.stderr)
+        traceback.print_exc(file=sys.stderr)
+
+
 def expose_game_data(request, response):
     """
     Intercept the 'web.[hash].js' script from colonist.io/dist/ and inject references
-    to `window.gameManager`, `window.uiGameManager`, etc.
+    to `window.gameManager`, `window.uiGameManager`, etc., plus the `window.__ctb`
+    state transition hook (see HOOK_PRELUDE).
     """
     try:
         if response and response.status_code == 200:
             # We only want to modify the main colonist dist scripts (web.xxxxx.js).
-            if ("colonist.io/dist/" in request.url and
-                    re.search(r'/web\.[0-9a-z]+\.(js|js\?.*)$', request.url)):
+            if is_game_bundle(request.url):
 
-                # Decode the response body (handle compression if needed).
-                original_body = decode(
-                    response.body,
-                    response.headers.get('Content-Encoding', 'identity')
-                )
-                body_str = original_body.decode('utf-8', errors='ignore')
+                def load_body():
+                    # Decode the response body (handle compression if needed).
+                    original_body = decode(
+                        response.body,
+                        response.headers.get('Content-Encoding', 'identity')
+                    )
+                    return original_body.decode('utf-8', errors='ignore')
 
-                # Inject our modifications:
-                new_body_str = body_str.replace(
-                    "this.forceHideAds=!1,this.uiGameManager=e,",
-                    "this.forceHideAds=1,window.uiGameManager=e,this.uiGameManager=e,",
-                    1  # replace only the first match
-                )
-                new_body_str = new_body_str.replace("this.endGameState=t,this.isReplayAvailable=i,",
-                    "this.endGameState=t,this.isReplayAvailable=i,window.endGameState=t,",
-                    1  # replace only the first match
-                )
+                # Inject our modifications (or reuse them from the cache):
+                response.body = patched_bundle(request.url, load_body)
 
-                # Re-encode and remove Content-Encoding so the browser sees it uncompressed.
-                response.body = new_body_str.encode('utf-8')
+                # Remove Content-Encoding so the browser sees it uncompressed.
                 if 'Content-Encoding' in response.headers:
                     del response.headers['Content-Encoding']
 
                 # Update content length
                 response.headers['Content-Length'] = str(len(response.body))
-                print('JS Intercepted...')
-                print(len(body_str))
-                print(len(new_body_str))
 
     except Exception as e:
         # Log any exceptions
         print(f"Interceptor error: {e}", file=sys.stderr)
-        traceback.print_exc(file=sys.stderr)
\ No newline at end of file
+        traceback.print_exc(file=sys.stderr)
+
+
+def _cached_bundle_headers(body):
+    headers = [{"name": k, "value": v} for k, v in BUNDLE_HEADERS.items()]
+    headers.append({"name": "Content-Length", "value": str(len(body))})
+    return headers
+
+
+def _patched_bundle_headers(params, body):
+    headers = [
+        h for h in params.get("responseHeaders", [])
+        if h["name"].lower() not in ("content-encoding", "content-length")
+    ]
+    headers.append({"name": "Content-Length", "value": str(len(body))})
+    return headers
+
+
+def _decode_response_body(response):
+    # Chromium hands us the body already decompressed.
+    if response.get("base64Encoded"):
+        return base64.b64decode(response["body"]).decode('utf-8', errors='ignore')
+    return response["body"]
+
+
+CDP_FETCH_PATTERNS = [
+    {"urlPattern": CDP_BUNDLE_PATTERN, "resourceType": "Script", "requestStage": "Request"},
+    {"urlPattern": CDP_BUNDLE_PATTERN, "resourceType": "Script", "requestStage": "Response"},
+]
+
+
+def enable_cdp_interception(session):
+    """
+    Rewrite the game bundle through the Chrome DevTools Fetch domain instead of
+    the selenium-wire proxy. Only requests matching CDP_BUNDLE_PATTERN are paused;
+    all other traffic goes straight through Chromium's network stack. Bundles
+    already in the cache are fulfilled before the request hits the network.
+
+    :param session: a cdp.CDPSession attached to the page target
+    """
+    def fulfill(request_id, body, headers):
+        session.send(
+            "Fetch.fulfillRequest",
+            requestId=request_id,
+            responseCode=200,
+            responseHeaders=headers,
+            body=base64.b64encode(body).decode('ascii'),
+        )
+
+    def on_request_paused(params):
+        request_id = params["requestId"]
+        url = params["request"]["url"]
+        try:
+            if is_game_bundle(url) and "responseStatusCode" not in params:
+                # Request stage: only a cache hit is handled here.
+                body = cached_bundle(url)
+                if body is not None:
+                    fulfill(request_id, body, _cached_bundle_headers(body))
+                    return
+
+            elif is_game_bundle(url) and params.get("responseStatusCode") == 200:
+                def load_body():
+                    return _decode_response_body(session.send("Fetch.getResponseBody", requestId=request_id))
+
+                body = patched_bundle(url, load_body)
+                fulfill(request_id, body, _patched_bundle_headers(params, body))
+                return
+        except Exception as e:
+            print(f"Interceptor error: {e}", file=sys.stderr)
+            traceback.print_exc(file=sys.stderr)
+
+        try:
+            session.send("Fetch.continueRequest", requestId=request_id)
+        except Exception as e:
+            print(f"Failed to continue request {request_id}: {e}", file=sys.stderr)
+
+    session.on("Fetch.requestPaused", on_request_paused)
+    session.send("Fetch.enable", patterns=CDP_FETCH_PATTERNS)
+
+
+async def enable_async_cdp_interception(session):
+    """
+    enable_cdp_interception() for a cdp.AsyncCDPSession: the same Fetch rewrite,
+    with every DevTools round trip awaited on the event loop. Reading, patching
+    and caching the multi-megabyte bundle runs on the loop's executor.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def fulfill(request_id, body, headers):
+        await session.send(
+            "Fetch.fulfillRequest",
+            requestId=request_id,
+            responseCode=200,
+            responseHeaders=headers,
+            body=base64.b64encode(body).decode('ascii'),
+        )
+
+    async def on_request_paused(params):
+        request_id = params["requestId"]
+        url = params["request"]["url"]
+        try:
+            if is_game_bundle(url) and "responseStatusCode" not in params:
+                body = await loop.run_in_executor(None, cached_bundle, url)
+                if body is not None:
+                    await fulfill(request_id, body, _cached_bundle_headers(body))
+                    return
+
+            elif is_game_bundle(url) and params.get("responseStatusCode") == 200:
+                # patched_bundle() loads the body synchronously, so fetch it up front.
+                response = await session.send("Fetch.getResponseBody", requestId=request_id)
+                body = await loop.run_in_executor(
+                    None, patched_bundle, url, lambda: _decode_response_body(response)
+                )
+                await fulfill(request_id, body, _patched_bundle_headers(params, body))
+                return
+        except Exception as e:
+            print(f"Interceptor error: {e}", file=sys.stderr)
+            traceback.print_exc(file=sys.stderr)
+
+        try:
+            await session.send("Fetch.continueRequest", requestId=request_id)
+        except Exception as e:
+            print(f"Failed to continue request {request_id}: {e}", file=sys.stderr)
+
+    session.on("Fetch.requestPaused", on_request_paused)
+    await session.send("Fetch.enable", patterns=CDP_FETCH_PATTERNS)
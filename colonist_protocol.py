@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+import json
+import base64
+
+try:
+    import msgpack
+except ImportError:  # only needed for binary frames
+    msgpack = None
+
+
+# Colonist's websocket protocol is not documented. Frames are JSON text or
+# MessagePack binary; each decoded message is classified by the first of these
+# payload keys it contains, which is a heuristic to be confirmed against frame
+# captures (see `summarize`). Extend MESSAGE_KINDS when a capture shows others.
+MESSAGE_KINDS = [
+    ("endGameState", "end"),  # final scores, same shape as uiGameManager.gameState.endGameState
+    ("gameState", "snapshot"),  # a complete gameState
+    ("diff", "diff"),  # a partial gameState to merge into the current one
+]
+# Where in a message the payload sits, tried in order; () is the message itself.
+PAYLOAD_PATHS = [("data", "payload"), ("data",), ("payload",), ()]
+
+
+class ProtocolError(Exception):
+    """A frame that cannot be decoded."""
+
+
+def decode_frame(data, binary=False):
+    """
+    Decode one websocket frame: `data` is text for JSON frames, or bytes (or
+    base64 text when `binary` is set, as in captures) for MessagePack frames.
+    """
+    if binary or isinstance(data, (bytes, bytearray)):
+        if isinstance(data, str):
+            data = base64.b64decode(data)
+        if msgpack is None:
+            raise ProtocolError("Binary frame received but msgpack is not installed")
+        try:
+            return msgpack.unpackb(data, raw=False, strict_map_key=False)
+        except Exception as e:
+            raise ProtocolError(f"Invalid MessagePack frame: {e}")
+    try:
+        return json.loads(data)
+    except ValueError as e:
+        raise ProtocolError(f"Invalid JSON frame: {e}")
+
+
+def _payload(message):
+    for path in PAYLOAD_PATHS:
+        node = message
+        for key in path:
+            node = node.get(key) if isinstance(node, dict) else None
+        if isinstance(node, dict):
+            return node
+    return None
+
+
+def classify(message):
+    """Return (kind, value) for a decoded message, or (None, None) if it is not a game update."""
+    payload = _payload(message)
+    if payload is None:
+        return None, None
+    for key, kind in MESSAGE_KINDS:
+        if key in payload:
+            return kind, payload[key]
+    return None, None
+
+
+def merge_diff(state, diff):
+    """
+    Return `state` with `diff` merged in: nested dicts are merged, None deletes
+    a key, anything else replaces. `state` itself is left untouched so earlier
+    snapshots in a state_log stay valid.
+    """
+    if not isinstance(state, dict) or not isinstance(diff, dict):
+        return diff
+    merged = dict(state)
+    for key, value in diff.items():
+        if value is None:
+            merged.pop(key, None)
+        elif isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_diff(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class GameModel:
+    """
+    The game state as rebuilt from server messages, equivalent to what the
+    browser monitors read from uiGameManager.gameState.
+    """
+
+    def __init__(self):
+        self.game_state = None
+        self.end_game_state = None
+        self.messages = 0
+        self.ignored = 0  # messages that were not game updates
+        self.kinds = {}  # kind -> count
+
+    @property
+    def current_state(self):
+        if not self.game_state:
+            return None
+        return self.game_state.get("currentState")
+
+    @property
+    def is_game_over(self):
+        return self.end_game_state is not None
+
+    def apply(self, message):
+        """Apply one decoded message; returns its kind, or None if it was ignored."""
+        self.messages += 1
+        kind, value = classify(message)
+        if kind == "snapshot":
+            self.game_state = value
+        elif kind == "diff":
+            if self.game_state is None:
+                # A diff before any snapshot cannot be applied meaningfully.
+                self.ignored += 1
+                return None
+            self.game_state = merge_diff(self.game_state, value)
+        elif kind == "end":
+            self.end_game_state = value
+        else:
+            self.ignored += 1
+            return None
+        self.kinds[kind] = self.kinds.get(kind, 0) + 1
+        return kind
+
+
+# Frame captures are JSON lines: {"t": seconds, "dir": "in"|"out", "binary": bool, "data": str}
+# with binary payloads base64 encoded.
+
+def capture_record(data, t, direction="in", binary=False):
+    if isinstance(data, (bytes, bytearray)):
+        data = base64.b64encode(data).decode("ascii")
+        binary = True
+    return {"t": t, "dir": direction, "binary": binary, "data": data}
+
+
+def read_capture(path):
+    """Yield the records of a frame capture file."""
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def replay(records, model=None):
+    """
+    Feed the incoming frames of a capture through a GameModel; yields
+    (record, kind) for every frame, with kind None for ignored or undecodable ones.
+    """
+    model = model or GameModel()
+    for record in records:
+        if record.get("dir", "in") != "in":
+            continue
+        try:
+            message = decode_frame(record["data"], record.get("binary", False))
+        except ProtocolError as e:
+            print(f"Skipping frame at {record.get('t')}: {e}")
+            yield record, None
+            continue
+        yield record, model.apply(message)
+
+
+def summarize(records):
+    """
+    Count incoming messages by their top-level and payload keys, to help map a
+    new capture onto MESSAGE_KINDS.
+    """
+    shapes = {}
+    for record in records:
+        if record.get("dir", "in") != "in":
+            continue
+        try:
+            message = decode_frame(record["data"], record.get("binary", False))
+        except ProtocolError:
+            shapes["<undecodable>"] = shapes.get("<undecodable>", 0) + 1
+            continue
+        payload = _payload(message)
+        top = sorted(message) if isinstance(message, dict) else [type(message).__name__]
+        inner = sorted(payload) if payload is not None else []
+        shape = f"{','.join(map(str, top))} / {','.join(map(str, inner))}"
+        shapes[shape] = shapes.get(shape, 0) + 1
+    return shapes
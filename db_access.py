@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo import ASCENDING
+from pymongo.errors import PyMongoError
+
+
+# (collection, keys, options) for every index the bot relies on; ensure_indexes()
+# creates them at startup and check_indexes() reports any that are missing.
+INDEXES = [
+    ("game_states", [("game_id", ASCENDING), ("timestamp", ASCENDING)],
+     {"name": "game_id_timestamp"}),
+    ("game_states", [("game_id", ASCENDING), ("run_id", ASCENDING), ("seq", ASCENDING)],
+     {"name": "game_id_run_id_seq", "partialFilterExpression": {"seq": {"$exists": True}}}),
+    ("game_states", [("game_id", ASCENDING)],
+     {"name": "final_state_by_game", "partialFilterExpression": {"is_final": True}}),
+    ("completed_games", [("game_id", ASCENDING)],
+     {"name": "game_id_unique", "unique": True}),
+    ("game_boards", [("game_id", ASCENDING), ("board_hash", ASCENDING)],
+     {"name": "game_id_board_hash", "unique": True}),
+    ("rounds", [("round_id", ASCENDING)],
+     {"name": "round_id_unique", "unique": True}),
+]
+
+
+def ensure_indexes(db):
+    """Create every index in INDEXES; returns a list of (collection, name, error) for failures."""
+    failures = []
+    for collection, keys, options in INDEXES:
+        try:
+            db[collection].create_index(keys, **options)
+        except PyMongoError as e:
+            # e.g. duplicate game_ids already stored, or the same keys under another name
+            print(f"Could not create index {collection}.{options['name']}: {e}")
+            failures.append((collection, options["name"], str(e)))
+    return failures
+
+
+def check_indexes(db):
+    """
+    Report {"missing": [(collection, name)], "usage": {collection: {name: ops}},
+    "collection_scans": server-wide count or None}.
+    """
+    report = {"missing": [], "usage": {}, "collection_scans": None}
+    for collection in sorted({c for c, _, _ in INDEXES}):
+        existing = db[collection].index_information()
+        for c, _, options in INDEXES:
+            if c == collection and options["name"] not in existing:
+                report["missing"].append((collection, options["name"]))
+        try:
+            report["usage"][collection] = {
+                stat["name"]: stat["accesses"]["ops"]
+                for stat in db[collection].aggregate([{"$indexStats": {}}])
+            }
+        except PyMongoError as e:
+            print(f"Could not read index stats for {collection}: {e}")
+
+    try:
+        scans = db.command("serverStatus")["metrics"]["queryExecutor"]["collectionScans"]
+        report["collection_scans"] = scans.get("total")
+    except (PyMongoError, KeyError) as e:
+        print(f"Could not read collection scan count: {e}")
+    return report
+
+
+class AsyncDB:
+    """
+    Async access to the bot's MongoDB database for Discord command handlers.
+
+    pymongo is blocking, so every operation runs on a small dedicated thread
+    pool instead of the event loop. Each operation is timed per
+    "collection.method" name; see `stats()`.
+    """
+
+    def __init__(self, db, max_workers=4, slow_threshold=0.5):
+        """
+        :param db: a pymongo Database
+        :param slow_threshold: operations slower than this many seconds are logged
+        """
+        self.db = db
+        self.slow_threshold = slow_threshold
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mongo")
+        self.timings = {}  # op name -> {"count", "total", "max"}
+
+    async def run(self, name, fn, *args, **kwargs):
+        """Run the blocking callable `fn` on the Mongo executor, timing it as `name`."""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self._record(name, time.perf_counter() - start)
+
+    async def find_one(self, collection, *args, **kwargs):
+        return await self.run(f"{collection}.find_one", self.db[collection].find_one, *args, **kwargs)
+
+    async def insert_one(self, collection, *args, **kwargs):
+        return await self.run(f"{collection}.insert_one", self.db[collection].insert_one, *args, **kwargs)
+
+    async def replace_one(self, collection, *args, **kwargs):
+        return await self.run(f"{collection}.replace_one", self.db[collection].replace_one, *args, **kwargs)
+
+    def stats(self):
+        """Return {op name: {"count", "avg_ms", "max_ms"}}."""
+        return {
+            name: {
+                "count": t["count"],
+                "avg_ms": round(1000 * t["total"] / t["count"], 1),
+                "max_ms": round(1000 * t["max"], 1),
+            }
+            for name, t in self.timings.items()
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    def _record(self, name, elapsed):
+        timing = self.timings.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+        timing["count"] += 1
+        timing["total"] += elapsed
+        timing["max"] = max(timing["max"], elapsed)
+        if elapsed > self.slow_threshold:
+            print(f"Slow MongoDB operation {name}: {elapsed:.2f}s")
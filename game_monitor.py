@@ -4,63 +4,282 @@ import time
 import json
 import traceback
 import threading
+from collections import namedtuple, deque
+
+from browser_pool import build_options, add_headless_arguments, create_driver, attach_interceptor
+from colonist_intercept import DEFAULT_BLOCK_PROFILE
+from colonist_protocol import GameModel, ProtocolError, decode_frame, capture_record
+from monitor_base import MonitorBase, Probe, apply_patch
+
+
+# Where a monitor takes state transitions from:
+#   "script" - the page-side hook, drained with execute_script probes
+#   "frames" - the game's own websocket frames, captured through CDP Network events
+#              (needs the "cdp" interception backend); script probes then only run
+#              every CONSISTENCY_INTERVAL seconds to check the rebuilt state
+STATE_SOURCES = ("script", "frames")
+CONSISTENCY_INTERVAL = 30
+FRAME_MISMATCH_LIMIT = 3  # consecutive failed checks before "frames" falls back to "script"
+GAME_SOCKET_PATTERN = "colonist.io"  # websockets whose URL contains this are captured
+
+READY_TIMEOUT = 60  # seconds to wait for uiGameManager before giving up
+READY_WAIT = 5.0  # seconds a dedicated driver waits per readiness script call
+NO_HOOK_GRACE = 5  # seconds a fully loaded page may go without the bundle patch
+# Text Colonist shows instead of a game for bad or expired game IDs.
+GAME_NOT_FOUND_PATTERN = r"(game|room) (was )?not found|(game|room) (does not|doesn't) exist"
+
+# Resolves with 'ready' once uiGameManager exists (via window.__ctb.ready when the hook
+# is installed), or 'not_found', 'unpatched' (bundle marker missing), 'no_hook' (page
+# loaded without the patched bundle) or 'waiting' after arguments[0] ms.
+READY_SCRIPT = """
+var waitMs = arguments[0], notFound = new RegExp(arguments[1], 'i'), done = arguments[arguments.length - 1];
+var finished = false, timer = null;
+function finish(status) {
+    if (finished) return;
+    finished = true;
+    clearInterval(timer);
+    done(status);
+}
+function check() {
+    if (location.hostname.indexOf('colonist.io') === -1) return;  // navigation not committed yet
+    var m = window.uiGameManager, patch = window.__ctbPatch;
+    if (m && m.gameController) finish('ready');
+    else if (patch && !patch.uiGameManager) finish('unpatched');
+    else if (document.body && notFound.test(document.body.innerText || '')) finish('not_found');
+    else if (!patch && document.readyState === 'complete') finish('no_hook');
+}
+check();
+if (!finished) {
+    if (window.__ctb) window.__ctb.ready.then(function () { finish('ready'); });
+    timer = setInterval(check, 250);
+    setTimeout(function () { finish('waiting'); }, waitMs);
+}
+"""
+
+# Discards transitions queued before monitoring began; reports whether the hook is installed.
+# Returns the last transition's sequence number, or null without the hook.
+RESET_EVENTS_SCRIPT = """
+if (!window.__ctb) return null;
+window.__ctb.drain();
+return window.__ctb.seq;
+"""
+
+# One round trip per tick. Waits up to arguments[1] ms for the page-side hook
+# (colonist_intercept.HOOK_PRELUDE) to record transitions, then returns
+# [currentState, gameStateHash, isGameOver, endGameState, patch, events].
+# The page keeps a copy of the last gameState it sent; `patch` is a JSON-Patch style
+# delta against it (or a whole-document replace if the caller's hash, arguments[0],
+# doesn't match that copy), and null when nothing changed. events is null without the hook.
+PROBE_SCRIPT = """
+var knownHash = arguments[0], waitMs = arguments[1], done = arguments[arguments.length - 1];
+function fnv1a(s) {
+    var h = 0x811c9dc5;
+    for (var i = 0; i < s.length; i++) {
+        h ^= s.charCodeAt(i);
+        h = Math.imul(h, 0x01000193);
+    }
+    return (h >>> 0).toString(16);
+}
+function isObject(v) {
+    return v !== null && typeof v === 'object';
+}
+function escapeKey(k) {
+    return String(k).replace(/~/g, '~0').replace(/\\//g, '~1');
+}
+function diff(a, b, path, ops) {
+    if (a === b) return;
+    if (!isObject(a) || !isObject(b) || Array.isArray(a) !== Array.isArray(b)) {
+        ops.push({op: 'replace', path: path, value: b});
+        return;
+    }
+    var i, k;
+    if (Array.isArray(a)) {
+        var common = Math.min(a.length, b.length);
+        for (i = 0; i < common; i++) diff(a[i], b[i], path + '/' + i, ops);
+        for (i = common; i < b.length; i++) ops.push({op: 'add', path: path + '/' + i, value: b[i]});
+        for (i = a.length - 1; i >= b.length; i--) ops.push({op: 'remove', path: path + '/' + i});
+        return;
+    }
+    for (k in a) {
+        if (a.hasOwnProperty(k) && !b.hasOwnProperty(k)) ops.push({op: 'remove', path: path + '/' + escapeKey(k)});
+    }
+    for (k in b) {
+        if (!b.hasOwnProperty(k)) continue;
+        if (a.hasOwnProperty(k)) diff(a[k], b[k], path + '/' + escapeKey(k), ops);
+        else ops.push({op: 'add', path: path + '/' + escapeKey(k), value: b[k]});
+    }
+}
+function probe(events) {
+    var m = window.uiGameManager;
+    var json = JSON.stringify(m.gameState) || "null";
+    var hash = fnv1a(json);
+    var gameState = JSON.parse(json);
+    var over = !!(gameState && gameState.isGameOver);
+    var patch = null;
+    if (hash !== knownHash) {
+        var sent = window.__ctbSent;
+        if (sent && sent.hash === knownHash) {
+            patch = [];
+            diff(sent.state, gameState, '', patch);
+        } else {
+            patch = [{op: 'replace', path: '', value: gameState}];
+        }
+        window.__ctbSent = {hash: hash, state: gameState};
+    }
+    done([
+        m.gameController.currentState,
+        hash,
+        over,
+        over ? (window.endGameState || null) : null,
+        patch,
+        events
+    ]);
+}
+if (window.__ctb) window.__ctb.wait(waitMs, probe); else probe(null);
+"""
+
+FrameEvent = namedtuple("FrameEvent", ["kind", "t", "current_state", "game_state"])
+
+
+class FrameCapture:
+    """
+    Rebuilds the game state from the websocket frames a tab receives, using
+    CDP Network events on the tab's CDPSession and colonist_protocol to decode
+    them. Runs on the session's dispatcher thread; the monitor collects the
+    resulting FrameEvents with `drain()`.
+    """
 
-from seleniumwire.webdriver import Chrome, ChromeOptions
-from selenium.webdriver.chrome.service import Service as ChromeService
-
-from colonist_intercept import expose_game_data
+    def __init__(self, session, capture_path=None):
+        """
+        :param capture_path: Optional file to append every captured frame to, in
+            colonist_protocol's capture format
+        """
+        self.session = session
+        self.model = GameModel()
+        self.events = deque()
+        self.lock = threading.Lock()
+        self.sockets = set()  # CDP request ids of game websockets
+        self.capture = open(capture_path, "a") if capture_path else None
+        self.stats = {"frames": 0, "updates": 0, "undecodable": 0, "mismatches": 0}
+
+        session.on("Network.webSocketCreated", self._on_created)
+        session.on("Network.webSocketFrameReceived", self._on_frame)
+        session.send("Network.enable")
+
+    def drain(self):
+        with self.lock:
+            events = list(self.events)
+            self.events.clear()
+        return events
+
+    def close(self):
+        self.session.off("Network.webSocketCreated", self._on_created)
+        self.session.off("Network.webSocketFrameReceived", self._on_frame)
+        if self.capture is not None:
+            self.capture.close()
+
+    def _on_created(self, params):
+        if GAME_SOCKET_PATTERN in params.get("url", ""):
+            self.sockets.add(params["requestId"])
+
+    def _on_frame(self, params):
+        if params["requestId"] not in self.sockets:
+            return
+        response = params["response"]
+        binary = response.get("opcode") == 2  # payloadData is base64 for binary frames
+        data = response.get("payloadData", "")
+        now = time.time()
+        self.stats["frames"] += 1
+        if self.capture is not None:
+            self.capture.write(json.dumps(capture_record(data, now, "in", binary)) + "\n")
+        try:
+            message = decode_frame(data, binary)
+        except ProtocolError:
+            self.stats["undecodable"] += 1
+            return
+        with self.lock:
+            kind = self.model.apply(message)
+            if kind is not None:
+                self.stats["updates"] += 1
+                self.events.append(FrameEvent(kind, now, self.model.current_state, self.model.game_state))
 
 
-class ColonistMonitor:
-    def __init__(self, db=None):
+class ColonistMonitor(MonitorBase):
+    def __init__(self, db=None, pool=None, poll_budget=None, interception=None,
+                 block=DEFAULT_BLOCK_PROFILE, writer=None, keyframe_interval=None, split_board=False,
+                 scheduler=None, state_source="script", frame_capture_path=None):
         """
         :param db: Optional reference to a MongoDB database object
+        :param writer: Optional StateWriter that batches game state inserts
+        :param keyframe_interval: Store a full keyframe every N state changes and
+            deltas in between; None stores every snapshot in full
+        :param split_board: Store the static board once per game in `game_boards`
+            instead of in every snapshot
+        :param pool: Optional BrowserPool to lease a tab from instead of starting a browser
+        :param poll_budget: Optional PollBudget shared with the other monitors
+        :param scheduler: Optional PollScheduler that runs this monitor's steps on
+            its shared worker threads instead of a dedicated thread
+        :param state_source: one of STATE_SOURCES; "frames" falls back to "script"
+            without a CDP session or when no frames could be decoded
+        :param frame_capture_path: Optional file to record the captured frames to
+        :param interception: "proxy" (selenium-wire) or "cdp" (DevTools Fetch); defaults
+            to the pool's backend, or "proxy" without a pool
+        :param block: colonist_intercept.BLOCK_PROFILES entry for a dedicated driver
+            (pooled tabs use the pool's profile)
         """
-        self.db = db
-
-        # Initialize ChromeOptions
-        self.options = ChromeOptions()
-        # Example user-agent override (optional):
-        self.options.add_argument(
-            "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:128.0) Gecko/20100101 Firefox/128.0"
-        )
+        super().__init__(db, writer=writer, keyframe_interval=keyframe_interval,
+                         split_board=split_board, poll_budget=poll_budget)
+        self.pool = pool
+        self.interception = interception
+        self.block = block
+        self.scheduler = scheduler
+        if state_source not in STATE_SOURCES:
+            raise ValueError(f"Unknown state source: {state_source}")
+        self.state_source = state_source
+        self.frame_capture_path = frame_capture_path
+        self.frames = None  # FrameCapture when state_source is "frames"
+        self.script_state = None  # the page's gameState as last probed, in "frames" mode
+        self.frame_mismatches = 0  # consecutive checks where the frames disagreed with the page
+        self.next_check = 0
+
+        # Initialize ChromeOptions (only used when not leasing from a pool)
+        self.options = build_options(block=block)
 
         self.driver = None
-        self.monitoring = False
-        self.game_id = None
-        self.end_game_state = None
-        self.player_names = {}
-
-        # We'll still keep an in-memory state log, but we can also store to DB
-        self.state_log = []
+        self.cdp = None  # DevTools session of a dedicated "cdp" driver
 
         self.monitor_thread = None
-        self.latest_update_time = 0
-        self.max_wait_seconds = 300  # 5 minutes
+        self.stage = None  # the step() stage that runs next
+        self.hooked = False  # whether the page-side transition hook is available
+        self.state_hash = None  # page-side hash of self.game_state
+        self.ready_deadline = None
+        self.no_hook_since = None
+        self.long_poll = False
+        self.interval = self.poll_policy.min_interval
 
     def start_driver(self):
-        """Set up the Selenium Wire driver for Chrome with response interceptor."""
-        # Specify the path to chromedriver if it's not in PATH
-        service = ChromeService(executable_path='/usr/bin/chromedriver')  # Adjust if necessary
-
-        self.driver = Chrome(
-            service=service,
-            options=self.options
-        )
-        # Restrict interception to colonist .js resources:
-        self.driver.scopes = [r'.*colonist\.io.*\.js(\?.*)?$']
-        self.driver.response_interceptor = expose_game_data
+        """
+        Set up the Selenium Wire driver for Chrome with response interceptor,
+        or lease a tab from the browser pool if one was given.
+        """
+        if self.pool is not None:
+            self.driver = self.pool.lease(self.interception)
+        else:
+            interception = self.interception or "proxy"
+            self.driver = create_driver(self.options, interception)
+            self.cdp = attach_interceptor(
+                self.driver, self.driver.current_window_handle, interception, self.block
+            )
 
     def headless(self):
         """Configure headless mode. Must be called before start_driver()."""
         if self.driver is None:
-            self.options.add_argument("--headless")
-            self.options.add_argument("--no-sandbox")
-            self.options.add_argument("--disable-gpu")
+            add_headless_arguments(self.options)
 
     def watch_game(self, game_id: str):
         """
-        Start watching a Colonist.io game in a background daemon thread.
+        Start watching a Colonist.io game, on the shared PollScheduler if the
+        monitor has one, otherwise in a background daemon thread.
         """
         if self.monitoring:
             print("Already monitoring a game.")
@@ -68,167 +287,315 @@ class ColonistMonitor:
 
         self.game_id = game_id
         self.monitoring = True
+        self.stage = self._step_load
 
-        self.monitor_thread = threading.Thread(target=self._monitor_game, daemon=True)
-        self.monitor_thread.start()
+        if self.scheduler is not None:
+            self.scheduler.schedule(self)
+        else:
+            self.monitor_thread = threading.Thread(target=self._monitor_game, daemon=True)
+            self.monitor_thread.start()
 
     def _monitor_game(self):
         """
-        Internal method to track the game. Polls ~20 times/second.
+        Internal method to track the game on a dedicated thread. State transitions
+        are pushed into a page-side queue by the injected hook and drained with a
+        long-poll; without the hook (or on a pooled tab) it polls at an interval
+        set by poll_policy, from ~20 times/second while the game is active down
+        to every 2 seconds.
         """
-        try:
-            print(f'Monitoring game {self.game_id}')
-            url = f"https://colonist.io/#{self.game_id}"
-            self.driver.get(url)
-            print(url)
-            # Wait for uiGameManager
-            print(f'Waiting for UI Manager {self.game_id}')
-
-            defined = False
-            attempts = 0
-            max_attempts = 60
-
-            expt = None
-            while not defined and attempts < max_attempts:
-                try:
-                    self.driver.execute_script("return window.uiGameManager.gameController.currentState;")
-                    defined = True
-                except Exception as e:
-                    expt = e
-                    attempts += 1
-                    time.sleep(1)
-
-            if not defined:
-                print("Game not found or uiGameManager undefined.")
-                print(expt)
-                self.monitoring = False
-                return
-
-            self.latest_update_time = time.time()
-
-            print(f'Getting initial state {self.game_id}')
-            # Grab initial states
-            prev_current_state = self.driver.execute_script(
-                "return window.uiGameManager.gameController.currentState;"
-            )
-            prev_game_state = self.driver.execute_script(
-                "return window.uiGameManager.gameState;"
-            )
-
-            self.player_names = self.get_player_names(prev_game_state)
-            self.state_log.append((prev_current_state, prev_game_state))
-            print(f'Storing state {self.game_id}')
-            self._store_game_state(prev_current_state, prev_game_state)
-
-            print(f'Starting loop {self.game_id}')
-            while True:
-                curr_game_state = self.driver.execute_script("return window.uiGameManager.gameState;")
-                if curr_game_state.get('isGameOver'):
-                    # The game ended
-                    time.sleep(1)
-                    self.end_game_state = self.driver.execute_script("return window.endGameState;")
-
-                    # Also store final end game state in DB
-                    if self.db and self.end_game_state is not None:
-                        self.db.game_states.insert_one({
-                            "game_id": self.game_id,
-                            "timestamp": time.time(),
-                            "current_state": "END",
-                            "game_state": self.end_game_state,
-                            "is_final": True
-                        })
-                    break
-                else:
-                    curr_current_state = self.driver.execute_script(
-                        "return window.uiGameManager.gameController.currentState;"
-                    )
-                    if curr_current_state != prev_current_state:
-                        # State changed => log it, store it
-                        self.latest_update_time = time.time()
-                        self.state_log.append((curr_current_state, curr_game_state))
-                        self._store_game_state(curr_current_state, curr_game_state)
-
-                        prev_current_state = curr_current_state
-                        prev_game_state = curr_game_state
-
-                    elapsed = time.time() - self.latest_update_time
-                    if elapsed > self.max_wait_seconds:
-                        print(json.dumps({"error": "Timed out waiting for game to end."}))
-                        break
-
-                time.sleep(0.05)
+        delay = self.step()
+        while delay is not None:
+            time.sleep(delay)
+            delay = self.step()
 
+    def step(self):
+        """
+        Run the current stage of monitoring (load the page, wait until it is
+        ready, poll once, read the final scores) and return how many seconds
+        until the next step is due, or None once monitoring has stopped.
+        """
+        try:
+            delay = self.stage()
         except Exception as exc:
             print(json.dumps({"error": str(exc)}))
             traceback.print_exc()
-        finally:
-            self.monitoring = False
-            if self.driver:
-                self.driver.quit()
-
-    def _store_game_state(self, current_state, game_state):
-        """Insert the current game state into MongoDB, if available."""
-        if self.db is not None:
-            try:
-                self.db.game_states.insert_one({
-                    "game_id": self.game_id,
-                    "timestamp": time.time(),
-                    "current_state": current_state,
-                    "game_state": game_state,
-                    "is_final": False
-                })
-                print(f"Stored game state for game_id: {self.game_id}")
-            except Exception as e:
-                print(f"Failed to insert game state into MongoDB: {e}")
-                traceback.print_exc()
-
-    def get_player_names(self, game_state: dict):
+            self.error = str(exc)
+            delay = None
+        if delay is None:
+            self._stop()
+        return delay
+
+    def _step_load(self):
+        print(f'Monitoring game {self.game_id}')
+        if self.state_source == "frames":
+            # Before navigating, so the game's websocket is seen being created.
+            session = self.cdp or getattr(self.driver, "cdp_session", None)
+            if session is None:
+                print(f"No CDP session for {self.game_id}, reading state with scripts instead of frames.")
+            else:
+                self.frames = FrameCapture(session, self.frame_capture_path)
+        url = f"https://colonist.io/#{self.game_id}"
+        self.driver.get(url)
+        print(url)
+        # Wait for uiGameManager
+        print(f'Waiting for UI Manager {self.game_id}')
+        self.ready_deadline = time.time() + READY_TIMEOUT
+        self.no_hook_since = None
+        self.stage = self._step_ready
+        return 0
+
+    def _step_ready(self):
         """
-        Return a dict mapping color -> username.
+        Check once whether the injected hook reports uiGameManager. Stops with
+        self.error set to why it never will: 'not_found', 'unpatched', 'no_hook'
+        or 'timeout'.
         """
-        names = {}
-        if not game_state:
-            return names
-        players = game_state.get('players', [])
-        for p in players:
-            color = p['state']['color']
-            username = p['userState'].get('username', f"Color{color}")
-            names[color] = username
-        return names
-
-    @staticmethod
-    def _calc_victory_points(vp_dict: dict):
+        if time.time() >= self.ready_deadline:
+            return self._not_ready('timeout')
+
+        # A pooled or scheduled tab must not block its WebDriver session or worker, so it checks instead of waiting.
+        wait = 0 if self.pool is not None or self.scheduler is not None else READY_WAIT
+        try:
+            status = self.driver.execute_async_script(READY_SCRIPT, int(wait * 1000), GAME_NOT_FOUND_PATTERN)
+        except Exception as e:
+            # Typically the document was replaced while the script was waiting.
+            print(f"Readiness check failed for {self.game_id}: {e}")
+            status = 'waiting'
+
+        if status == 'ready':
+            return self._start_polling()
+        if status in ('not_found', 'unpatched'):
+            return self._not_ready(status)
+        if status == 'no_hook':
+            self.no_hook_since = self.no_hook_since or time.time()
+            if time.time() - self.no_hook_since > NO_HOOK_GRACE:
+                return self._not_ready(status)
+        if not wait or status != 'waiting':
+            return 0.25
+        return 0
+
+    def _not_ready(self, reason):
+        self.error = reason
+        print(f"Game not found or uiGameManager undefined ({self.error}).")
+        return None
+
+    def _start_polling(self):
+        self.latest_update_time = time.time()
+
+        print(f'Getting initial state {self.game_id}')
+        # Grab initial states
+        self._reset_events(self.driver.execute_script(RESET_EVENTS_SCRIPT))
+        if not self.hooked:
+            print(f"State hook missing for {self.game_id}, falling back to polling.")
+        self._record_initial(self.probe())
+        if self.frames is not None:
+            self.script_state = self.game_state
+            self.next_check = time.time() + CONSISTENCY_INTERVAL
+
+        # A pooled tab shares its WebDriver session and a scheduled one a worker thread,
+        # so only a dedicated driver on its own thread blocks in a long-poll.
+        self.long_poll = self.hooked and self.pool is None and self.scheduler is None
+        self.interval = self.poll_policy.min_interval
+
+        print(f'Starting loop {self.game_id}')
+        self.stage = self._step_poll
+        return 0
+
+    def _reset_events(self, seq):
+        """Take the result of RESET_EVENTS_SCRIPT."""
+        self.hooked = seq is not None
+        self.event_seq = seq
+
+    def _step_poll(self):
+        if self.frames is not None:
+            return self._step_frames()
+        probe = self.probe(self.interval if self.long_poll else 0)
+        changed = self._record_probe(probe)
+
+        if probe.is_game_over:
+            # The game ended
+            return self._game_over(probe.end_game_state)
+
+        elapsed = time.time() - self.latest_update_time
+        if elapsed > self.max_wait_seconds:
+            print(json.dumps({"error": "Timed out waiting for game to end."}))
+            self.error = 'stalled'
+            return None
+
+        self.interval = self.poll_policy.next_interval(changed)
+        return 0 if self.long_poll else self.interval
+
+    def _step_frames(self):
+        """Poll stage for the "frames" state source."""
+        if time.time() >= self.next_check:
+            self.next_check = time.time() + CONSISTENCY_INTERVAL
+            check = self._check_frames()
+            if check.is_game_over:
+                return self._game_over(check.end_game_state)
+            if self.frames is None:
+                return 0  # fell back to script probes
+
+        events = self.frames.drain()
+        model = self.frames.model
+        with self.frames.lock:
+            game_state, end_game_state = model.game_state, model.end_game_state
+        if game_state is not None:
+            self.game_state = game_state
+        probe = Probe(
+            events[-1].current_state if events else self.prev_current_state, None,
+            end_game_state is not None, end_game_state, None,
+            [{"state": e.current_state, "t": e.t * 1000, "game_state": e.game_state}
+             for e in events if e.kind != "end"],
+        )
+        changed = self._record_probe(probe)
+
+        if probe.is_game_over:
+            return self._game_over(end_game_state)
+
+        elapsed = time.time() - self.latest_update_time
+        if elapsed > self.max_wait_seconds:
+            print(json.dumps({"error": "Timed out waiting for game to end."}))
+            self.error = 'stalled'
+            return None
+
+        self.interval = self.poll_policy.next_interval(changed)
+        return self.interval
+
+    def _check_frames(self):
         """
-        Colonist stores victory points in a dict (string -> int).
-        Key '0' => 1x, '1' => 2x, etc., but you can adapt as needed.
+        Probe the page with a script, compare it to the state rebuilt from frames
+        and return the probe. On a mismatch the frame model is reset to the page's
+        state. Switches to script probes (self.frames becomes None) if the page
+        reports the game over, or if the frames have not produced a game state at
+        all or disagreed with the page FRAME_MISMATCH_LIMIT checks in a row.
         """
-        multipliers = {'0': 1, '1': 2, '2': 1, '3': 2, '4': 2}
-        pts = 0
-        for key, multiplier in multipliers.items():
-            pts += vp_dict.get(key, 0) * multiplier
-        return pts
+        # probe() diffs against the page's last sent gameState, so it keeps its own copy.
+        frame_state, self.game_state = self.game_state, self.script_state
+        try:
+            probe = self.probe()
+        finally:
+            self.script_state, self.game_state = self.game_state, frame_state
+
+        if probe.is_game_over:
+            # The page can see the end before (or without) the frames; finish with its state.
+            self._use_scripts(probe)
+            return probe
+
+        with self.frames.lock:
+            frame_game_state = self.frames.model.game_state
+            frame_current = self.frames.model.current_state
+        if frame_game_state is None:
+            print(f"No game state decoded from {self.frames.stats['frames']} frames for {self.game_id}, "
+                  f"reading state with scripts instead.")
+            self._use_scripts(probe)
+            return probe
+        if probe.current_state == frame_current:
+            self.frame_mismatches = 0
+            return probe
+
+        self.frames.stats["mismatches"] += 1
+        self.frame_mismatches += 1
+        print(f"Frame state for {self.game_id} differs from the page: "
+              f"{json.dumps(frame_current)} vs {json.dumps(probe.current_state)}")
+        if self.frame_mismatches >= FRAME_MISMATCH_LIMIT:
+            print(f"Frames for {self.game_id} disagreed with the page {self.frame_mismatches} times, "
+                  f"reading state with scripts instead.")
+            self._use_scripts(probe)
+            return probe
+        # Take the page's state, so a wrong frame model cannot make the game look stalled.
+        # Later frames are merged into it, and events queued from the old model are dropped.
+        with self.frames.lock:
+            self.frames.model.game_state = self.script_state
+            self.frames.events.clear()
+        self.game_state = self.script_state
+        self._record_probe(probe._replace(events=[{"state": probe.current_state, "game_state": self.script_state}]))
+        return probe
+
+    def _use_scripts(self, probe):
+        """Switch a "frames" monitor to script probes, starting from the `probe` _check_frames() took."""
+        self.frames.close()
+        self.frames = None
+        self.game_state = self.script_state
+        if probe.current_state != self.prev_current_state:
+            self._record_probe(probe._replace(events=[{"state": probe.current_state}]))
+        self.event_seq = None  # the checks drained page-side events without counting them
+
+    def _game_over(self, end_game_state):
+        self.end_game_state = end_game_state
+        if self.end_game_state is None:
+            # endGameState is assigned slightly after isGameOver flips.
+            self.stage = self._step_game_over
+            return 1
+        return self._step_game_over()
+
+    def _step_game_over(self):
+        if self.end_game_state is None:
+            self.end_game_state = self.probe().end_game_state
+
+        # Also store final end game state in DB
+        if self.end_game_state is not None:
+            self._store_game_state("END", self.end_game_state, is_final=True)
+        return None
+
+    def _stop(self):
+        try:
+            self.poll_policy.close()
+            if self.frames is not None:
+                self.frames.close()
+            if self.cdp:
+                self.cdp.close()
+            if self.driver:
+                # For a pooled tab this returns it to the pool.
+                self.driver.quit()
+        except Exception as exc:
+            print(f"Error releasing the browser for game {self.game_id}: {exc}")
+            traceback.print_exc()
+        finally:
+            if self.writer is not None and self.scheduler is not None:
+                # flush() can block for a while; keep it off the scheduler's worker threads.
+                threading.Thread(target=self._flush_and_finish, daemon=True).start()
+            else:
+                self._flush_and_finish()
 
-    def _calculate_victory_points(self, game_state):
+    def _flush_and_finish(self):
+        try:
+            if self.writer is not None:
+                # Make sure the whole game is in Mongo before reporting it as ended.
+                self.writer.flush()
+        except Exception as exc:
+            print(f"Error flushing game states for game {self.game_id}: {exc}")
+            traceback.print_exc()
+        finally:
+            self.monitoring = False
+            self._finish()
+
+    def probe(self, wait=0):
         """
-        Return {username: vps}
+        Fetch currentState, the gameState hash, the game-over flag and endGameState
+        (once the game is over) in a single script call, waiting up to `wait`
+        seconds for a transition when the page-side hook is installed.
+
+        Only the paths of gameState that changed since the last probe are
+        transferred, and `self.game_state` is patched to match the page.
         """
-        output = {}
-        players = game_state.get('players', [])
-        for player in players:
-            username = player['userState'].get('username', "Unknown")
-            vp_dict = player['state'].get('victoryPointsState', {})
-            pts = self._calc_victory_points(vp_dict)
-            output[username] = pts
-        return output
+        result = Probe(*self.driver.execute_async_script(PROBE_SCRIPT, self.state_hash, int(wait * 1000)))
+        if result.patch is not None:
+            self.game_state = apply_patch(self.game_state, result.patch)
+            self.state_hash = result.state_hash
+        return result
+
+def get_poll_stats(monitor: ColonistMonitor):
+    """
+    Helper to retrieve the monitor's current polling interval and backoff counters.
+    """
+    return monitor.poll_stats()
 
 
 def get_status(monitor: ColonistMonitor):
     """
     Helper to retrieve current victory points from the last known game_state.
     """
-    if monitor.state_log:
-        return monitor._calculate_victory_points(monitor.state_log[-1][1])
-    return None
+    return monitor.current_scores()
 
 
 def main():
@@ -237,11 +604,12 @@ def main():
       python game_monitor.py <gameId>
     """
     if len(sys.argv) < 2:
-        print("Usage: python game_monitor.py <gameId>")
+        print("Usage: python game_monitor.py <gameId> [proxy|cdp]")
         sys.exit(1)
 
     game_id = sys.argv[1]
-    monitor = ColonistMonitor()
+    interception = sys.argv[2] if len(sys.argv) > 2 else "proxy"
+    monitor = ColonistMonitor(interception=interception)
     monitor.headless()
     monitor.start_driver()
     monitor.watch_game(game_id)
@@ -249,14 +617,9 @@ def main():
     while monitor.monitoring:
         time.sleep(1)
 
-    if monitor.end_game_state:
-        output = {}
-        for color_str, info in monitor.end_game_state['players'].items():
-            vps = monitor._calc_victory_points(info.get('victoryPoints', {}))
-            color_int = int(color_str)
-            name = monitor.player_names.get(color_int, f"Color{color_int}")
-            output[name] = vps
-        print("Final results:", output)
+    results = monitor.final_results()
+    if results:
+        print("Final results:", {name: vps for name, vps, _ in results})
     else:
         print("No final end_game_state found or monitoring timed out.")
 
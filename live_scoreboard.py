@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+import time
+import asyncio
+import traceback
+
+import discord
+
+
+class ChannelRateLimiter:
+    """
+    Spaces out message edits per Discord channel.
+
+    Discord allows roughly five message edits per channel every five seconds,
+    shared by every scoreboard in that channel, so each edit reserves the
+    channel's next free slot at least `min_interval` seconds after the last one.
+    """
+
+    def __init__(self, min_interval=1.5):
+        self.min_interval = min_interval
+        self.next_slot = {}  # channel id -> earliest time of the next edit
+
+    async def wait(self, channel_id):
+        now = time.monotonic()
+        slot = max(now, self.next_slot.get(channel_id, 0.0))
+        self.next_slot[channel_id] = slot + self.min_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class LiveScoreboard:
+    """
+    One Discord message per watched game, edited as its scores change.
+
+    The monitor thread only marks the scoreboard dirty; an updater task on the
+    event loop waits for a rate limiter slot and then renders the latest state,
+    so any number of state changes in between collapse into a single edit.
+    Edits whose text has not changed are skipped.
+    """
+
+    def __init__(self, monitor, channel, render, limiter, loop=None):
+        """
+        :param render: Callable returning the message text for the monitor's latest state
+        :param limiter: ChannelRateLimiter shared by every scoreboard
+        """
+        self.monitor = monitor
+        self.channel = channel
+        self.render = render
+        self.limiter = limiter
+        self.loop = loop or asyncio.get_event_loop()
+
+        self.message = None
+        self.text = None  # text currently shown in the message
+        self.dirty = asyncio.Event()
+        self.stopped = False
+        self.task = None
+        self.stats = {"changes": 0, "edits": 0, "skipped": 0}
+
+    async def start(self):
+        """Post the scoreboard message and start following the monitor."""
+        self.text = self.render()
+        self.message = await self.channel.send(self.text)
+        self.monitor.add_state_listener(self._on_state)
+        self.task = self.loop.create_task(self._run())
+
+    async def stop(self):
+        """Apply a last update (e.g. the final scores) and stop editing."""
+        self.stopped = True
+        self.monitor.remove_state_listener(self._on_state)
+        self.dirty.set()
+        if self.task is not None:
+            await self.task
+
+    def _on_state(self, monitor):
+        # Called on the monitor thread.
+        self.stats["changes"] += 1
+        try:
+            self.loop.call_soon_threadsafe(self.dirty.set)
+        except RuntimeError:
+            pass  # the event loop has been closed
+
+    async def _run(self):
+        while True:
+            await self.dirty.wait()
+            await self.limiter.wait(self.channel.id)
+            # Clear after the wait so changes that arrived meanwhile are part of this edit.
+            self.dirty.clear()
+            try:
+                await self._update()
+            except discord.NotFound:
+                print(f"Scoreboard message for game {self.monitor.game_id} was deleted, stopping updates.")
+                return
+            except Exception as e:
+                print(f"Error updating scoreboard for game {self.monitor.game_id}: {e}")
+                traceback.print_exc()
+            if self.stopped:
+                return
+
+    async def _update(self):
+        text = self.render()
+        if text == self.text:
+            self.stats["skipped"] += 1
+            return
+        await self.message.edit(content=text)
+        self.text = text
+        self.stats["edits"] += 1
@@ -6,14 +6,50 @@ import asyncio
 import traceback
 
 from discord.ext import commands
-from game_monitor import ColonistMonitor, get_status
+from game_monitor import ColonistMonitor, get_status, get_poll_stats
+from browser_pool import BrowserPool, INTERCEPTION_BACKENDS
+from polling import PollBudget, PollScheduler
+from live_scoreboard import LiveScoreboard, ChannelRateLimiter
+from monitor_workers import MonitorWorkers
+from async_monitor import AsyncColonistMonitor
+from spectator import SpectatorObserver
 
 # --- MongoDB Setup ---
-from pymongo import MongoClient
+from pymongo import MongoClient, WriteConcern
+from state_writer import StateWriter
+from db_access import AsyncDB, ensure_indexes, check_indexes
 
 MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017")
-mongo_client = MongoClient(MONGO_URI)
-db = mongo_client["colonist_db"]  # choose any database name you like
+DB_NAME = "colonist_db"  # choose any database name you like
+# The client and the state writer run background threads, so open_database() creates
+# them only after any monitor worker processes have been forked (see __main__ below).
+mongo_client = None
+db = None
+# Command handlers go through db_access so blocking pymongo calls never run on the event loop.
+db_access = None
+
+# Game state snapshots are written behind, in batches, by a single shared writer.
+# STATE_WRITE_CONCERN is the "w" value for those inserts, e.g. "1", "0" or "majority".
+STATE_WRITE_CONCERN = os.environ.get("STATE_WRITE_CONCERN", "1")
+STATE_WRITER_CONFIG = dict(
+    batch_size=int(os.environ.get("STATE_BATCH_SIZE", "100")),
+    flush_interval=float(os.environ.get("STATE_FLUSH_INTERVAL", "1.0")),
+    max_buffer=int(os.environ.get("STATE_MAX_BUFFER", "5000")),
+    write_concern=WriteConcern(w=int(STATE_WRITE_CONCERN) if STATE_WRITE_CONCERN.isdigit() else STATE_WRITE_CONCERN),
+)
+state_writer = None
+# Store a full game state every KEYFRAME_INTERVAL changes and only deltas in between (0 = always full).
+KEYFRAME_INTERVAL = int(os.environ.get("KEYFRAME_INTERVAL", "20"))
+
+
+def open_database():
+    """Connect to MongoDB and start the shared state writer."""
+    global mongo_client, db, db_access, state_writer
+    mongo_client = MongoClient(MONGO_URI)
+    db = mongo_client[DB_NAME]
+    db_access = AsyncDB(db)
+    state_writer = StateWriter(db, **STATE_WRITER_CONFIG)
+
 
 # Try reading the Discord token from the file
 DISCORD_TOKEN = None
@@ -30,6 +66,31 @@ except Exception as e:
 # ---------------------------
 BOT_PREFIX = "!"
 MAX_HISTORY = 100  # Keep only the last 100 completed games in memory if you want
+BROWSER_POOL_SIZE = int(os.environ.get("BROWSER_POOL_SIZE", "2"))  # Chromium processes shared by all games
+TABS_PER_BROWSER = int(os.environ.get("TABS_PER_BROWSER", "8"))  # Game tabs per Chromium process
+WARM_TABS_LOW = int(os.environ.get("WARM_TABS_LOW", "2"))  # Refill pre-warmed tabs below this many
+WARM_TABS_HIGH = int(os.environ.get("WARM_TABS_HIGH", "4"))  # ...up to this many
+POLL_BUDGET = float(os.environ.get("POLL_BUDGET", "100"))  # Probes per second shared by all games
+POLL_WORKERS = int(os.environ.get("POLL_WORKERS", "4"))  # Threads that poll all games (per monitor worker process)
+INTERCEPTION = os.environ.get("INTERCEPTION", "proxy")  # Default bundle interception: "proxy" or "cdp"
+# `!watch` backends: the interception backends, or "async" for a dedicated Chromium
+# driven over DevTools from the bot's event loop (always runs in the bot process).
+WATCH_BACKENDS = INTERCEPTION_BACKENDS + ("async",)
+# Browserless "spectator" backend: Colonist websocket URL and JSON list of messages to send
+# after connecting, both with {game_id} placeholders. Only offered when SPECTATOR_URL is set.
+SPECTATOR_URL = os.environ.get("SPECTATOR_URL")
+SPECTATOR_JOIN = json.loads(os.environ.get("SPECTATOR_JOIN", "[]"))
+if SPECTATOR_URL:
+    WATCH_BACKENDS += ("spectator",)
+BLOCK_PROFILE = os.environ.get("BLOCK_PROFILE", "safe")  # Requests to block: "off", "safe" or "lean"
+STATE_SOURCE = os.environ.get("STATE_SOURCE", "script")  # "script" or "frames" (websocket frames, needs "cdp")
+# Run monitors in this many worker processes instead of the bot process (0 = in-process).
+# Each worker gets its own browser pool (the pool settings above apply per worker) and
+# an equal share of POLL_BUDGET.
+MONITOR_WORKERS = int(os.environ.get("MONITOR_WORKERS", "0"))
+WATCH_CONCURRENCY = int(os.environ.get("WATCH_CONCURRENCY", "4"))  # Games `!watchround` starts at the same time
+WATCH_RETRIES = int(os.environ.get("WATCH_RETRIES", "2"))  # Extra attempts for a game whose browser fails to start
+LIVE_EDIT_INTERVAL = float(os.environ.get("LIVE_EDIT_INTERVAL", "1.5"))  # Min seconds between scoreboard edits per channel
 
 # ---------------------------
 # Global Stores (Memory) [Optional]
@@ -37,6 +98,38 @@ MAX_HISTORY = 100  # Keep only the last 100 completed games in memory if you wan
 active_monitors = {}
 completed_history = {}
 recent_game_ids = []
+starting_games = {}  # game ID -> channel IDs subscribed while `!watch` is still waiting for a browser tab
+browser_pool = BrowserPool(
+    max_browsers=BROWSER_POOL_SIZE,
+    tabs_per_browser=TABS_PER_BROWSER,
+    warm_low=WARM_TABS_LOW,
+    warm_high=WARM_TABS_HIGH,
+    interception=INTERCEPTION,
+    block=BLOCK_PROFILE,
+)
+poll_budget = PollBudget(max_polls_per_second=POLL_BUDGET)
+poll_scheduler = PollScheduler(workers=POLL_WORKERS)
+monitor_workers = None
+if MONITOR_WORKERS > 0:
+    monitor_workers = MonitorWorkers(MONITOR_WORKERS, {
+        "mongo_uri": MONGO_URI,
+        "db_name": DB_NAME,
+        "pool": dict(
+            max_browsers=BROWSER_POOL_SIZE,
+            tabs_per_browser=TABS_PER_BROWSER,
+            warm_low=WARM_TABS_LOW,
+            warm_high=WARM_TABS_HIGH,
+            interception=INTERCEPTION,
+            block=BLOCK_PROFILE,
+        ),
+        "poll_budget": POLL_BUDGET / MONITOR_WORKERS,
+        "poll_workers": POLL_WORKERS,
+        "writer": STATE_WRITER_CONFIG,
+        "monitor": dict(keyframe_interval=KEYFRAME_INTERVAL, split_board=True, state_source=STATE_SOURCE),
+    })
+watch_semaphore = None  # caps concurrent browser starts, created on the bot's loop in on_ready
+live_scoreboards = {}  # game ID -> {channel ID: LiveScoreboard}
+edit_limiter = ChannelRateLimiter(min_interval=LIVE_EDIT_INTERVAL)
 
 # ---------------------------
 # Bot Setup
@@ -49,67 +142,72 @@ bot = commands.Bot(command_prefix=BOT_PREFIX, intents=intents)
 # ---------------------------
 # Utility Functions
 # ---------------------------
-def store_completed_game(game_id: str, results: tuple, channel_id: int):
+async def broadcast(channel_ids, text: str):
+    """
+    Send the same message to every channel in `channel_ids`; a channel that
+    cannot be found or written to does not stop the others.
+    """
+    async def send(channel_id):
+        channel = bot.get_channel(channel_id)
+        if not channel:
+            return  # Can't find channel
+        try:
+            await channel.send(text)
+        except discord.HTTPException as e:
+            print(f"Could not send to channel {channel_id}: {e}")
+
+    await asyncio.gather(*(send(channel_id) for channel_id in channel_ids))
+
+
+async def store_completed_game(game_id: str, results: tuple, channel_ids: list):
     """
     Store completed game results in the global in-memory history (optional).
     Also store in Mongo if you want.
     """
+    channel_id = channel_ids[0] if channel_ids else None
     completed_history[game_id] = {
         "results": results,
         "timestamp": time.time(),
         "channel_id": channel_id,
+        "channel_ids": channel_ids,
     }
     recent_game_ids.append(game_id)
     if len(recent_game_ids) > MAX_HISTORY:
         oldest_id = recent_game_ids.pop(0)
         completed_history.pop(oldest_id, None)
 
-    # Optionally store final results into Mongo as well
-    db.completed_games.insert_one({
+    # Optionally store final results into Mongo as well (game_id is unique, a re-watched game replaces its result)
+    await db_access.replace_one("completed_games", {"game_id": game_id}, {
         "game_id": game_id,
         "results": results,
         "timestamp": time.time(),
-        "channel_id": channel_id
-    })
+        "channel_id": channel_id,
+        "channel_ids": channel_ids,
+    }, upsert=True)
 
 
 async def post_final_results(game_id: str):
     """
     Once a game ends, fetch final results from the ColonistMonitor
-    and post them to the original channel.
+    and post them to every subscribed channel.
     """
     try:
         monitor_info = active_monitors.pop(game_id, None)
         if not monitor_info:
             return
 
-        channel_id = monitor_info["channel_id"]
-        channel = bot.get_channel(channel_id)
-        if not channel:
-            return  # Can't find channel
-
+        channel_ids = list(monitor_info["channel_ids"])
         monitor = monitor_info["monitor"]
-        end_game_state = monitor.end_game_state
+        final_results = monitor.final_results()
 
-        if not end_game_state or "players" not in end_game_state:
+        if not final_results:
             # Possibly a load failure or time out
-            await channel.send(f"Game **{game_id}** ended, but no final scores were retrieved.")
-            store_completed_game(game_id, {}, channel_id)
+            await broadcast(channel_ids, f"Game **{game_id}** ended, but no final scores were retrieved.")
+            await store_completed_game(game_id, {}, channel_ids)
             return
 
-        # Build the final results
-        final_results = []
-        if len(monitor.state_log) > 0:
-            monitor.get_player_names(monitor.state_log[-1][1])
-        for color_str, player_info in end_game_state['players'].items():
-            color_int = int(color_str)
-            username = monitor.player_names.get(color_int, f"Color{color_int}")
-            winner = player_info.get('winningPlayer', False)
-            vps = monitor._calc_victory_points(player_info['victoryPoints'])
-            final_results.append((username, vps, winner))
-        
         # Store in global history (optional) and in DB
-        store_completed_game(game_id, final_results, channel_id)
+        await store_completed_game(game_id, final_results, channel_ids)
 
         # Format a response
         lines = []
@@ -120,67 +218,194 @@ async def post_final_results(game_id: str):
                 lines.append(f"{user}: {vps} points")
 
         msg = f"**Game {game_id}** has ended! Final scores:\n" + "\n".join(lines)
-        await channel.send(msg)
+        await broadcast(channel_ids, msg)
     
     except Exception as e:
         print(f"Error in post_final_results for game {game_id}: {e}")
         traceback.print_exc()
 
 
-async def monitor_cleanup_loop():
+def new_monitor(interception: str = None):
     """
-    Background task to periodically check if any monitored games have completed.
-    If completed, post final results and remove from active monitors.
+    Create a monitor for one game: a ColonistMonitor in this process, or a
+    proxy for one in a worker process when MONITOR_WORKERS is set.
     """
-    await bot.wait_until_ready()
-    while not bot.is_closed():
-        ended_game_ids = []
-        for gid, info in list(active_monitors.items()):
-            monitor = info["monitor"]
-            if not monitor.monitoring:
-                # The game ended or timed out
-                channel_id = info["channel_id"]
-                channel = bot.get_channel(channel_id)
-                if channel:
-                    await channel.send(f"**Game {gid}** has ended!")
-                ended_game_ids.append(gid)
+    if interception == "spectator":
+        return SpectatorObserver(
+            SPECTATOR_URL, SPECTATOR_JOIN, db, writer=state_writer,
+            keyframe_interval=KEYFRAME_INTERVAL, split_board=True,
+        )
+    if interception == "async":
+        return AsyncColonistMonitor(
+            db, poll_budget=poll_budget, block=BLOCK_PROFILE, writer=state_writer,
+            keyframe_interval=KEYFRAME_INTERVAL, split_board=True,
+        )
+    if monitor_workers is not None:
+        return monitor_workers.monitor(interception)
+    return ColonistMonitor(
+        db, pool=browser_pool, poll_budget=poll_budget, interception=interception,
+        writer=state_writer, keyframe_interval=KEYFRAME_INTERVAL, split_board=True,
+        scheduler=poll_scheduler, state_source=STATE_SOURCE,
+    )  # Pass the db to your monitor
+
+
+def render_scoreboard(game_id: str, monitor: ColonistMonitor):
+    """
+    Text of a game's live scoreboard message.
+    """
+    status = get_status(monitor)
+    header = f"Live victory points for **{game_id}**" if monitor.monitoring else f"Game **{game_id}** has ended"
+    if not status:
+        return header + ":\nNo state info yet."
+    lines = [f"**{user}**: {vps} points" for user, vps in sorted(status.items(), key=lambda item: -item[1])]
+    return header + ":\n" + "\n".join(lines)
 
-        for gid in ended_game_ids:
-            await post_final_results(gid)
 
-        await asyncio.sleep(5)
+async def announce_when_done(game_id: str, monitor: ColonistMonitor):
+    """
+    Wait for a monitor's thread to finish (the game ended or timed out),
+    then post final results and remove it from active monitors.
+    """
+    await monitor.completion_future(asyncio.get_running_loop())
+    info = active_monitors.get(game_id)
+    if not info or info["monitor"] is not monitor:
+        return
+    scoreboards = live_scoreboards.pop(game_id, {})
+    await asyncio.gather(*(scoreboard.stop() for scoreboard in scoreboards.values()))
+    await broadcast(info["channel_ids"], f"**Game {game_id}** has ended!")
+    await post_final_results(game_id)
 
 
 # ---------------------------
 # Bot Commands
 # ---------------------------
+async def start_watch(game_id: str, channel_id: int, interception: str = None, retries: int = 0):
+    """
+    Start monitoring a game and report it to `channel_id` when it ends. A game
+    that is already being watched only gains `channel_id` as a subscriber, so
+    there is one monitor per game however many channels follow it.
+    Returns one of "started", "subscribed", "watching", "completed" or "failed";
+    a browser that fails to start is retried up to `retries` more times with a
+    growing delay.
+    """
+    subscribers = active_monitors[game_id]["channel_ids"] if game_id in active_monitors else starting_games.get(game_id)
+    if subscribers is not None:
+        if channel_id in subscribers:
+            return "watching"
+        subscribers.append(channel_id)
+        return "subscribed"
+
+    if game_id in completed_history:
+        return "completed"
+
+    subscribers = starting_games[game_id] = [channel_id]
+    try:
+        for attempt in range(retries + 1):
+            if attempt:
+                # Back off without holding a startup slot, so the rest of a round keeps going.
+                await asyncio.sleep(2 ** attempt)
+            monitor = new_monitor(interception)
+            try:
+                async with watch_semaphore:
+                    if isinstance(monitor, (AsyncColonistMonitor, SpectatorObserver)):
+                        await monitor.start_driver()
+                    else:
+                        # Leasing may still have to start a browser; keep that off the event loop.
+                        await bot.loop.run_in_executor(None, monitor.start_driver)
+                break
+            except Exception as e:
+                print(f"Failed to start driver for game {game_id} (attempt {attempt + 1}): {e}")
+                traceback.print_exc()
+        else:
+            # Channels that subscribed while this was starting have no one else to tell them.
+            await broadcast([c for c in subscribers if c != channel_id],
+                            f"Could not start a browser for game **{game_id}**.")
+            return "failed"
+    finally:
+        starting_games.pop(game_id, None)
+    monitor.watch_game(game_id)
+
+    active_monitors[game_id] = {
+        "monitor": monitor,
+        "channel_ids": subscribers,  # the first entry is the channel that started the watch
+    }
+    bot.loop.create_task(announce_when_done(game_id, monitor))
+    return "started"
+
+
 @bot.command(name="watch")
-async def watch_game(ctx, game_id: str):
+async def watch_game(ctx, game_id: str, interception: str = None):
     """
-    Usage: !watch #<gameId>
-    Start watching a Colonist.io game in a background thread.
+    Usage: !watch #<gameId> [proxy|cdp|async]
+    Start watching a Colonist.io game in the background, optionally
+    choosing how the game bundle is intercepted.
     """
     if game_id.startswith("#"):
         game_id = game_id[1:]
 
-    if game_id in active_monitors:
-        await ctx.send(f"Already watching game **{game_id}**.")
+    if interception is not None and interception not in WATCH_BACKENDS:
+        await ctx.send(f"Unknown interception backend **{interception}**, use one of: {', '.join(WATCH_BACKENDS)}.")
         return
 
-    if game_id in completed_history:
+    status = await start_watch(game_id, ctx.channel.id, interception)
+    if status == "watching":
+        await ctx.send(f"Already watching game **{game_id}**.")
+    elif status == "subscribed":
+        await ctx.send(f"Game **{game_id}** is already being watched, this channel will get its results too.")
+    elif status == "completed":
         await ctx.send(f"Game **{game_id}** is already completed.")
+    elif status == "failed":
+        await ctx.send(f"Could not start a browser for game **{game_id}**.")
+    else:
+        await ctx.send(f"Started watching Colonist.io game: **{game_id}**")
+
+
+@bot.command(name="watchround")
+async def watch_round(ctx, *ids: str):
+    """
+    Usage: !watchround <roundId> | !watchround #<gameId> #<gameId> ...
+    Start watching every game of a tournament round, either listed directly or
+    looked up by round ID in the `rounds` collection, and report one summary.
+    """
+    if not ids:
+        await ctx.send("Usage: `!watchround <roundId>` or `!watchround #<gameId> #<gameId> ...`")
         return
 
-    monitor = ColonistMonitor(db)  # Pass the db to your monitor
-    monitor.headless()
-    monitor.start_driver()
-    monitor.watch_game(game_id)
+    game_ids = ids
+    if len(ids) == 1 and not ids[0].startswith("#"):
+        found = await db_access.find_one("rounds", {"round_id": ids[0]})
+        if found:
+            game_ids = found.get("game_ids", [])
+    # Drop duplicates, keep order
+    game_ids = list(dict.fromkeys(gid[1:] if gid.startswith("#") else gid for gid in game_ids))
+    if not game_ids:
+        await ctx.send(f"Round **{ids[0]}** has no games.")
+        return
 
-    active_monitors[game_id] = {
-        "monitor": monitor,
-        "channel_id": ctx.channel.id,
-    }
-    await ctx.send(f"Started watching Colonist.io game: **{game_id}**")
+    message = await ctx.send(f"Starting {len(game_ids)} games...")
+    statuses = await asyncio.gather(
+        *(start_watch(gid, ctx.channel.id, retries=WATCH_RETRIES) for gid in game_ids),
+        return_exceptions=True,
+    )
+
+    groups = {}
+    for gid, status in zip(game_ids, statuses):
+        if isinstance(status, Exception):
+            print(f"Error starting game {gid}: {status}")
+            status = "failed"
+        groups.setdefault(status, []).append(gid)
+    labels = [
+        ("started", "Started"),
+        ("subscribed", "Added this channel to"),
+        ("watching", "Already watching"),
+        ("completed", "Already completed"),
+        ("failed", "Failed to start"),
+    ]
+    lines = [f"Round of {len(game_ids)} games:"]
+    for status, label in labels:
+        if status in groups:
+            lines.append(f"{label} ({len(groups[status])}): " + ", ".join(f"**{gid}**" for gid in groups[status]))
+    await message.edit(content="\n".join(lines))
 
 
 @bot.command(name="gamestate")
@@ -221,7 +446,7 @@ async def game_state(ctx, game_id: str):
         return
 
     # Check DB if not in memory (optional if you want to support queries after memory is lost)
-    found_in_db = db.completed_games.find_one({"game_id": game_id})
+    found_in_db = await db_access.find_one("completed_games", {"game_id": game_id})
     if found_in_db:
         results = found_in_db.get("results", [])
         if not results:
@@ -240,15 +465,173 @@ async def game_state(ctx, game_id: str):
     await ctx.send(f"Game **{game_id}** not found in memory or DB.")
 
 
+@bot.command(name="unwatch")
+async def unwatch_game(ctx, game_id: str):
+    """
+    Usage: !unwatch #<gameId>
+    Stop posting a watched game's results and live scores in this channel.
+    The game stays monitored (and stored) until it ends.
+    """
+    if game_id.startswith("#"):
+        game_id = game_id[1:]
+
+    info = active_monitors.get(game_id)
+    if not info or ctx.channel.id not in info["channel_ids"]:
+        await ctx.send(f"This channel is not following game **{game_id}**.")
+        return
+
+    info["channel_ids"].remove(ctx.channel.id)
+    scoreboard = live_scoreboards.get(game_id, {}).pop(ctx.channel.id, None)
+    if scoreboard:
+        await scoreboard.stop()
+    await ctx.send(f"This channel will no longer get updates for game **{game_id}**.")
+
+
+@bot.command(name="live")
+async def live_scores(ctx, game_id: str):
+    """
+    Usage: !live #<gameId>
+    Post a scoreboard for a watched game that is edited as the scores change.
+    Each subscribed channel can have its own; the channel is subscribed if it wasn't.
+    """
+    if game_id.startswith("#"):
+        game_id = game_id[1:]
+
+    if game_id not in active_monitors:
+        await ctx.send(f"Not watching game **{game_id}**, start it with `!watch #{game_id}` first.")
+        return
+    if active_monitors[game_id]["monitor"].finished:
+        # announce_when_done() is already posting the results and has stopped the scoreboards.
+        await ctx.send(f"Game **{game_id}** has just ended, its final scores are on the way.")
+        return
+
+    scoreboards = live_scoreboards.setdefault(game_id, {})
+    if ctx.channel.id in scoreboards:
+        message = scoreboards[ctx.channel.id].message
+        await ctx.send(f"Game **{game_id}** already has a live scoreboard here: {message.jump_url}")
+        return
+
+    info = active_monitors[game_id]
+    if ctx.channel.id not in info["channel_ids"]:
+        info["channel_ids"].append(ctx.channel.id)
+    monitor = info["monitor"]
+    scoreboard = LiveScoreboard(
+        monitor, ctx.channel, lambda: render_scoreboard(game_id, monitor), edit_limiter, bot.loop
+    )
+    scoreboards[ctx.channel.id] = scoreboard
+    try:
+        await scoreboard.start()
+    except Exception:
+        scoreboards.pop(ctx.channel.id, None)
+        raise
+    if monitor.finished and not scoreboard.stopped:
+        # The game ended while the message was being posted, after the other scoreboards were stopped.
+        scoreboards.pop(ctx.channel.id, None)
+        await scoreboard.stop()
+
+
+@bot.command(name="pollstats")
+async def poll_stats(ctx):
+    """
+    Usage: !pollstats
+    Show each active game's polling interval and backoff counters, and how
+    late the poll scheduler runs polls.
+    """
+    if not active_monitors:
+        await ctx.send("No games are being watched.")
+        return
+
+    if monitor_workers is not None:
+        schedulers = sorted((f"Worker {i} scheduler", stats) for i, stats in monitor_workers.scheduler_stats.items())
+    else:
+        schedulers = [("Scheduler", poll_scheduler.stats())]
+    lines = [
+        f"{label}: {stats['busy']}/{stats['workers']} threads busy, {stats['scheduled']} queued, "
+        f"lag avg {stats['avg_lag_ms']}ms max {stats['max_lag_ms']}ms, {stats['late']} of {stats['runs']} polls late"
+        for label, stats in schedulers
+    ]
+    for gid, info in active_monitors.items():
+        stats = get_poll_stats(info["monitor"])
+        lines.append(
+            f"**{gid}**: every {stats['interval']}s (avg {stats['avg_interval']}s), "
+            f"{stats['polls']} polls, {stats['changes']} changes, "
+            f"{stats['backoffs']} backoffs, {stats['throttled']} throttled"
+            + (f", {stats['lost']} transitions lost" if stats.get("lost") else "")
+        )
+    header = f"Polling {len(active_monitors)} games, budget {POLL_BUDGET:g} polls/s:\n"
+    await ctx.send(header + "\n".join(lines))
+
+
+@bot.command(name="dbstats")
+async def db_stats(ctx):
+    """
+    Usage: !dbstats
+    Show the game state write-behind buffer's depth and counters, and how long
+    the bot's own MongoDB operations take.
+    """
+    stats = state_writer.stats
+    lines = [
+        f"Game state writer: {state_writer.depth()} queued (max {stats['max_depth']}), "
+        f"{stats['written']} written in {stats['batches']} batches, {stats['failed']} rejected, "
+        f"{stats['retried_batches']} retried batches, {stats['blocked_puts']} blocked puts "
+        f"({stats['blocked_seconds']:.1f}s), {stats['dropped']} dropped"
+    ]
+    for name, timing in sorted(db_access.stats().items()):
+        lines.append(f"{name}: {timing['count']} calls, avg {timing['avg_ms']}ms, max {timing['max_ms']}ms")
+    await ctx.send("\n".join(lines))
+
+
+@bot.command(name="indexes")
+async def index_check(ctx):
+    """
+    Usage: !indexes
+    Report missing MongoDB indexes, per-index usage and the server's collection scan count.
+    """
+    report = await db_access.run("check_indexes", check_indexes, db)
+    lines = []
+    if report["missing"]:
+        lines.append("Missing indexes: " + ", ".join(f"{c}.{name}" for c, name in report["missing"]))
+    else:
+        lines.append("All indexes are present.")
+    for collection, usage in report["usage"].items():
+        counts = ", ".join(f"{name}: {ops}" for name, ops in sorted(usage.items()))
+        lines.append(f"{collection} index uses: {counts or 'none'}")
+    if report["collection_scans"] is not None:
+        lines.append(f"Collection scans since MongoDB started: {report['collection_scans']}")
+    await ctx.send("\n".join(lines))
+
+
 @bot.event
 async def on_ready():
     print(f"Bot has logged in as {bot.user}")
-    bot.loop.create_task(monitor_cleanup_loop())
+    global watch_semaphore
+    if watch_semaphore is None:
+        watch_semaphore = asyncio.Semaphore(WATCH_CONCURRENCY)
+    if monitor_workers is None:
+        browser_pool.start()
+        poll_scheduler.start()
 
 
 if __name__ == "__main__":
     if not DISCORD_TOKEN:
         print("No token found in 'discord_token.txt'. Exiting.")
         exit(1)
+    if monitor_workers is not None:
+        # Forked before this process starts any MongoClient or writer threads.
+        monitor_workers.start()
+    open_database()
+    print('Creating MongoDB indexes...')
+    try:
+        ensure_indexes(db)
+    except Exception as e:
+        print(f"Index creation failed, continuing without it: {e}")
     print('Starting bot...')
-    bot.run(DISCORD_TOKEN)
\ No newline at end of file
+    try:
+        bot.run(DISCORD_TOKEN)
+    finally:
+        if monitor_workers is not None:
+            monitor_workers.shutdown()
+        poll_scheduler.shutdown()
+        browser_pool.shutdown()
+        state_writer.close()
+        db_access.shutdown()
\ No newline at end of file
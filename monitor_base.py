@@ -0,0 +1,606 @@
+#!/usr/bin/env python3
+"""
+The parts of a game monitor that do not touch a browser: recording state
+transitions, storing them (keyframes, deltas and boards) and scoring. Kept
+free of selenium imports so the browserless SpectatorObserver and the
+tests can use them without selenium-wire installed.
+"""
+import time
+import json
+import asyncio
+import functools
+import hashlib
+import traceback
+import threading
+from collections import namedtuple
+
+from bson import ObjectId
+from polling import AdaptivePollPolicy
+
+
+# Parts of gameState that are fixed for the whole game (hex tiles with their number
+# tokens, and ports). They are stored once per game in `game_boards`.
+STATIC_BOARD_PATHS = [
+    ("mapState", "tileHexStates"),
+    ("mapState", "portEdgeStates"),
+]
+
+Probe = namedtuple(
+    "Probe", ["current_state", "state_hash", "is_game_over", "end_game_state", "patch", "events"]
+)
+
+
+def _unescape_pointer(token):
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def apply_patch(doc, patch):
+    """
+    Apply a JSON-Patch style list of add / replace / remove operations, as produced
+    by PROBE_SCRIPT, and return the new document.
+
+    Containers along each patched path are copied rather than modified in place,
+    so earlier snapshots (e.g. entries in `state_log`) that share structure with
+    `doc` stay unchanged.
+    """
+    for op in patch:
+        if op["path"] == "":
+            doc = op.get("value")
+            continue
+        keys = [_unescape_pointer(k) for k in op["path"][1:].split("/")]
+        doc = _patched(doc, keys, op)
+    return doc
+
+
+def _patched(node, keys, op):
+    if isinstance(node, list):
+        node = list(node)
+        key = int(keys[0])
+    else:
+        node = dict(node)
+        key = keys[0]
+
+    if len(keys) > 1:
+        node[key] = _patched(node[key], keys[1:], op)
+    elif op["op"] == "remove":
+        del node[key]
+    elif op["op"] == "add" and isinstance(node, list):
+        node.insert(key, op["value"])
+    else:
+        node[key] = op["value"]
+    return node
+
+
+def _escape_pointer(key):
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def diff_states(old, new):
+    """
+    Return the JSON-Patch style operations that turn `old` into `new`, in the
+    same form PROBE_SCRIPT produces and apply_patch consumes.
+    """
+    ops = []
+    _diff(old, new, "", ops)
+    return ops
+
+
+def _diff(a, b, path, ops):
+    if a is b:
+        # Unchanged subtrees are shared between snapshots, see apply_patch.
+        return
+    if isinstance(a, dict) and isinstance(b, dict):
+        for key in a:
+            if key not in b:
+                ops.append({"op": "remove", "path": f"{path}/{_escape_pointer(key)}"})
+        for key, value in b.items():
+            if key in a:
+                _diff(a[key], value, f"{path}/{_escape_pointer(key)}", ops)
+            else:
+                ops.append({"op": "add", "path": f"{path}/{_escape_pointer(key)}", "value": value})
+    elif isinstance(a, list) and isinstance(b, list):
+        common = min(len(a), len(b))
+        for i in range(common):
+            _diff(a[i], b[i], f"{path}/{i}", ops)
+        for i in range(common, len(b)):
+            ops.append({"op": "add", "path": f"{path}/{i}", "value": b[i]})
+        for i in range(len(a) - 1, len(b) - 1, -1):
+            ops.append({"op": "remove", "path": f"{path}/{i}"})
+    elif type(a) is not type(b) or a != b:
+        ops.append({"op": "replace", "path": path, "value": b})
+
+
+_MISSING = object()
+
+
+def _get_path(doc, path):
+    for key in path:
+        if not isinstance(doc, dict) or key not in doc:
+            return _MISSING
+        doc = doc[key]
+    return doc
+
+
+def _with_path(doc, path, value):
+    """Copy-on-write set (or, for _MISSING, delete) of a nested dict key."""
+    doc = dict(doc)
+    if len(path) == 1:
+        if value is _MISSING:
+            doc.pop(path[0], None)
+        else:
+            doc[path[0]] = value
+    else:
+        doc[path[0]] = _with_path(doc.get(path[0], {}), path[1:], value)
+    return doc
+
+
+def split_board(game_state):
+    """
+    Split a gameState into (board, dynamic): `board` maps "mapState/tileHexStates"
+    style paths to the static parts listed in STATIC_BOARD_PATHS, and `dynamic` is
+    a copy of the state without them.
+    """
+    board = {}
+    dynamic = game_state
+    for path in STATIC_BOARD_PATHS:
+        value = _get_path(game_state, path)
+        if value is not _MISSING:
+            board["/".join(path)] = value
+            dynamic = _with_path(dynamic, path, _MISSING)
+    return board, dynamic
+
+
+def join_board(dynamic, board):
+    """Inverse of split_board()."""
+    game_state = dynamic
+    for key, value in board.items():
+        game_state = _with_path(game_state, tuple(key.split("/")), value)
+    return game_state
+
+
+def board_hash(board):
+    return hashlib.sha1(json.dumps(board, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _load_board(db, game_id, doc, boards):
+    """Return the board a stored snapshot refers to, caching lookups in `boards`."""
+    key = doc.get("board_hash")
+    if key is None:
+        return None
+    if key not in boards:
+        found = db.game_boards.find_one({"game_id": game_id, "board_hash": key})
+        boards[key] = found["board"] if found else None
+        if found is None:
+            print(f"Board {key} of game {game_id} is missing from game_boards.")
+    return boards[key]
+
+
+def _with_board(db, game_id, doc, game_state, boards):
+    board = _load_board(db, game_id, doc, boards)
+    return join_board(game_state, board) if board else game_state
+
+
+def load_game_state(db, game_id, seq=None, timestamp=None, run_id=None):
+    """
+    Rebuild a stored snapshot as (current_state, game_state), or None if there is
+    none. Picks the snapshot with sequence number `seq`, else the last one at or
+    before `timestamp`, else the latest. Works for both full documents and the
+    keyframe + delta format: a delta is rebuilt from its nearest keyframe. The
+    static board is joined back in from `game_boards` where it was split off.
+
+    Sequence numbers restart with every monitor run of a game; `run_id` picks the
+    run, otherwise the latest run with a matching snapshot is used.
+    """
+    query = {"game_id": game_id, "is_final": False}
+    if run_id is not None:
+        query["run_id"] = run_id
+    if seq is not None:
+        query["seq"] = seq
+    elif timestamp is not None:
+        query["timestamp"] = {"$lte": timestamp}
+    target = db.game_states.find_one(query, sort=[("timestamp", -1), ("seq", -1)])
+    if target is None:
+        return None
+    boards = {}
+    if target.get("kind", "full") != "delta":
+        return target["current_state"], _with_board(db, game_id, target, target["game_state"], boards)
+
+    run = target.get("run_id")  # None also matches documents stored before runs were recorded
+    keyframe = db.game_states.find_one(
+        {"game_id": game_id, "run_id": run, "seq": target["keyframe_seq"], "kind": "keyframe"}
+    )
+    deltas = list(db.game_states.find(
+        {"game_id": game_id, "run_id": run, "kind": "delta",
+         "seq": {"$gt": target["keyframe_seq"], "$lte": target["seq"]}},
+        sort=[("seq", 1)],
+    ))
+    if keyframe is None or len(deltas) != target["seq"] - target["keyframe_seq"]:
+        print(f"Cannot rebuild state {target['seq']} of game {game_id}: keyframe or deltas missing.")
+        return None
+
+    game_state = keyframe["game_state"]
+    for delta in deltas:
+        game_state = apply_patch(game_state, delta["patch"])
+    return target["current_state"], _with_board(db, game_id, target, game_state, boards)
+
+
+def iter_game_states(db, game_id):
+    """
+    Yield (timestamp, current_state, game_state) for every stored snapshot of a
+    game in order, run by run, applying each delta to the previous snapshot and
+    joining the static board back in. Deltas after a gap in the sequence are
+    skipped up to the next keyframe.
+    """
+    game_state = None
+    run = prev_seq = None
+    boards = {}
+    for doc in db.game_states.find({"game_id": game_id, "is_final": False},
+                                   sort=[("run_id", 1), ("seq", 1), ("timestamp", 1)]):
+        if doc.get("run_id") != run:
+            run, game_state, prev_seq = doc.get("run_id"), None, None
+        if doc.get("kind") == "delta":
+            if game_state is not None and doc["seq"] != prev_seq + 1:
+                print(f"Game {game_id} is missing states {prev_seq + 1}-{doc['seq'] - 1}, "
+                      f"skipping to the next keyframe.")
+                game_state = None
+            prev_seq = doc["seq"]
+            if game_state is None:
+                continue  # the keyframe or a delta this one builds on was never stored
+            game_state = apply_patch(game_state, doc["patch"])
+        else:
+            game_state = doc["game_state"]
+            prev_seq = doc.get("seq")
+        yield doc["timestamp"], doc["current_state"], _with_board(db, game_id, doc, game_state, boards)
+
+
+class MonitorEvents:
+    """
+    State-change listeners and completion callbacks shared by ColonistMonitor
+    and monitor_workers.MonitorProxy, so the bot can follow either one.
+    """
+
+    def __init__(self):
+        self.finished = False  # set once monitoring has stopped and been cleaned up
+        self.done_callbacks = []
+        self.done_lock = threading.Lock()
+        self.state_listeners = []  # called with the monitor after each batch of state changes
+
+    def add_done_callback(self, callback):
+        """
+        Call `callback(monitor)` from a background thread once monitoring has stopped
+        and the driver is released, or right away if that has already happened.
+        """
+        with self.done_lock:
+            if not self.finished:
+                self.done_callbacks.append(callback)
+                return
+        callback(self)
+
+    def add_state_listener(self, callback):
+        """
+        Call `callback(monitor)` from a background thread whenever new states
+        have been seen. Several transitions seen by one probe are
+        reported once, so callbacks should read the latest state themselves.
+        """
+        self.state_listeners.append(callback)
+
+    def remove_state_listener(self, callback):
+        if callback in self.state_listeners:
+            self.state_listeners.remove(callback)
+
+    def _notify_state(self):
+        for callback in list(self.state_listeners):
+            try:
+                callback(self)
+            except Exception as e:
+                print(f"Error in state listener for game {self.game_id}: {e}")
+                traceback.print_exc()
+
+    def completion_future(self, loop):
+        """Return an asyncio future on `loop` that resolves to this monitor when it stops."""
+        future = loop.create_future()
+
+        def resolve(_future):
+            if not _future.done():
+                _future.set_result(self)
+
+        self.add_done_callback(lambda monitor: loop.call_soon_threadsafe(resolve, future))
+        return future
+
+    def _finish(self):
+        with self.done_lock:
+            self.finished = True
+            callbacks, self.done_callbacks = self.done_callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                print(f"Error in done callback for game {self.game_id}: {e}")
+                traceback.print_exc()
+
+
+
+class MonitorBase(MonitorEvents):
+    """
+    State log, storage and scoring shared by ColonistMonitor and
+    spectator.SpectatorObserver. Subclasses set `game_id`, fill `game_state`
+    and feed transitions to _record_initial() and _record_probe().
+    """
+
+    def __init__(self, db=None, writer=None, keyframe_interval=None, split_board=False, poll_budget=None):
+        """
+        :param db: Optional reference to a MongoDB database object
+        :param writer: Optional StateWriter that batches game state inserts
+        :param keyframe_interval: Store a full keyframe every N state changes and
+            deltas in between; None stores every snapshot in full
+        :param split_board: Store the static board once per game in `game_boards`
+            instead of in every snapshot
+        :param poll_budget: Optional PollBudget shared with the other monitors
+        """
+        super().__init__()
+        self.db = db
+        self.writer = writer
+        self.put_timeout = None  # how long a full StateWriter may block; None is its own default
+        self.keyframe_interval = keyframe_interval
+        self.split_board = split_board
+        self.poll_policy = AdaptivePollPolicy(budget=poll_budget)
+
+        self.monitoring = False
+        self.game_id = None
+        self.error = None  # why monitoring stopped early, if it did
+        self.end_game_state = None
+        self.player_names = {}
+
+        # We'll still keep an in-memory state log, but we can also store to DB
+        self.state_log = []
+
+        self.event_seq = None  # sequence number of the last page-side transition seen
+        self.lost_transitions = 0  # transitions the page-side ring buffer overwrote before a drain
+        self.game_state = None  # latest gameState seen
+        self.prev_current_state = None
+
+        # Keyframe + delta storage bookkeeping
+        self.run_id = ObjectId()  # tags this run's snapshots, as seq restarts when a game is watched again
+        self.store_seq = 0
+        self.keyframe_seq = None
+        self.stored_state = None
+        self.stored_board = None  # (board, board_hash) last written to game_boards
+        self.latest_update_time = 0
+        self.max_wait_seconds = 300  # 5 minutes
+
+
+    def _record_initial(self, probe):
+        """Log and store the state the game was in when monitoring started."""
+        self.prev_current_state = probe.current_state
+        self.player_names = self.get_player_names(self.game_state)
+        self.state_log.append((self.prev_current_state, self.game_state))
+        print(f'Storing state {self.game_id}')
+        self._store_game_state(self.prev_current_state, self.game_state)
+        self._notify_state()
+
+    def _check_sequence(self, events):
+        """Count transitions lost to a ring buffer overflow, from gaps in the events' sequence numbers."""
+        if not events or "seq" not in events[0]:
+            return
+        first, last = events[0]["seq"], events[-1]["seq"]
+        if self.event_seq is not None and first > self.event_seq + 1:
+            lost = first - self.event_seq - 1
+            self.lost_transitions += lost
+            print(f"Page-side buffer overflowed for {self.game_id}: {lost} transitions lost")
+        # A lower number means the page (and its counter) was reloaded.
+        self.event_seq = last
+
+    def _record_probe(self, probe):
+        """Log and store the transitions one probe reported; returns whether currentState changed."""
+        changed = False
+        events = probe.events
+        self._check_sequence(events)
+        if events is None:
+            # No page-side hook: compare the polled currentState instead.
+            changed = probe.current_state != self.prev_current_state
+            events = [{"state": probe.current_state}] if changed else []
+        elif probe.current_state != (events[-1]["state"] if events else self.prev_current_state):
+            # Editing currentState in place fires no hook event, but the probe still reads it.
+            events = events + [{"state": probe.current_state}]
+
+        for event in events:
+            curr_current_state = event["state"]
+            if curr_current_state != self.prev_current_state:
+                # State changed => log it, store it
+                self.latest_update_time = time.time()
+                # Frame events carry the gameState as of that transition.
+                game_state = event.get("game_state", self.game_state)
+                self.state_log.append((curr_current_state, game_state))
+                self._store_game_state(curr_current_state, game_state,
+                                       event.get("t", time.time() * 1000) / 1000)
+
+                self.prev_current_state = curr_current_state
+                changed = True
+
+        if changed:
+            self._notify_state()
+        return changed
+
+    def _store_game_state(self, current_state, game_state, timestamp=None, is_final=False):
+        """
+        Insert the current game state into MongoDB, if available. With a StateWriter
+        the document is queued for a batched write instead of inserted right away.
+
+        With `keyframe_interval` set, snapshots are numbered by `seq` and stored as a
+        full "keyframe" every N changes or a "delta" (a patch against the previous
+        snapshot) in between; use load_game_state() to read them back.
+
+        With `split_board`, the static board is written to `game_boards` when first
+        seen and snapshots keep only the dynamic remainder plus a `board_hash`.
+        """
+        doc = {
+            "game_id": self.game_id,
+            "timestamp": timestamp or time.time(),
+            "current_state": current_state,
+            "game_state": game_state,
+            "is_final": is_final
+        }
+        if self.split_board and not is_final:
+            board, game_state = split_board(game_state)
+            doc["game_state"] = game_state
+            doc["board_hash"] = self._store_board(board)
+
+        if self.keyframe_interval and not is_final:
+            seq = self.store_seq
+            self.store_seq += 1
+            doc["run_id"] = self.run_id
+            doc["seq"] = seq
+            if self.stored_state is None or seq - self.keyframe_seq >= self.keyframe_interval:
+                doc["kind"] = "keyframe"
+                self.keyframe_seq = seq
+            else:
+                doc["kind"] = "delta"
+                doc["patch"] = diff_states(self.stored_state, game_state)
+                del doc["game_state"]
+            doc["keyframe_seq"] = self.keyframe_seq
+            self.stored_state = game_state
+
+        if self.writer is not None:
+            stored = self.writer.put(doc, timeout=self.put_timeout)
+        elif self.db is not None:
+            try:
+                self.db.game_states.insert_one(doc)
+                stored = True
+                print(f"Stored game state for game_id: {self.game_id}")
+            except Exception as e:
+                stored = False
+                print(f"Failed to insert game state into MongoDB: {e}")
+                traceback.print_exc()
+        else:
+            stored = True
+        if not stored:
+            # Later deltas would build on the lost document; start over with a keyframe.
+            self.stored_state = None
+
+    def _store_board(self, board):
+        """Write the board to `game_boards` unless it is the one already stored; returns its hash."""
+        if self.stored_board is not None:
+            last_board, last_hash = self.stored_board
+            # Snapshots share unchanged subtrees, so an identical board is usually the same objects.
+            if all(board.get(k) is v for k, v in last_board.items()) and len(board) == len(last_board):
+                return last_hash
+
+        key = board_hash(board)
+        if self.stored_board is None or key != self.stored_board[1]:
+            if self.db is not None and not self._write_board(key, board):
+                return key
+        self.stored_board = (board, key)
+        return key
+
+    def _write_board(self, key, board):
+        """Upsert a board into `game_boards`; returns whether it was stored."""
+        try:
+            self.db.game_boards.update_one(
+                {"game_id": self.game_id, "board_hash": key},
+                {"$setOnInsert": {"board": board, "timestamp": time.time()}},
+                upsert=True,
+            )
+            return True
+        except Exception as e:
+            print(f"Failed to store board for game {self.game_id}: {e}")
+            traceback.print_exc()
+            return False
+
+    def get_player_names(self, game_state: dict):
+        """
+        Return a dict mapping color -> username.
+        """
+        names = {}
+        if not game_state:
+            return names
+        players = game_state.get('players', [])
+        for p in players:
+            color = p['state']['color']
+            username = p['userState'].get('username', f"Color{color}")
+            names[color] = username
+        return names
+
+    @staticmethod
+    def _calc_victory_points(vp_dict: dict):
+        """
+        Colonist stores victory points in a dict (string -> int).
+        Key '0' => 1x, '1' => 2x, etc., but you can adapt as needed.
+        """
+        multipliers = {'0': 1, '1': 2, '2': 1, '3': 2, '4': 2}
+        pts = 0
+        for key, multiplier in multipliers.items():
+            pts += vp_dict.get(key, 0) * multiplier
+        return pts
+
+    def current_scores(self):
+        """
+        Return {username: vps} for the latest state, or None before the first one.
+        """
+        if self.state_log:
+            return self._calculate_victory_points(self.state_log[-1][1])
+        return None
+
+    def final_results(self):
+        """
+        Return [(username, vps, is_winner)] from endGameState, or None if the
+        game did not finish (load failure or time out).
+        """
+        if not self.end_game_state or "players" not in self.end_game_state:
+            return None
+        results = []
+        for color_str, player_info in self.end_game_state['players'].items():
+            color_int = int(color_str)
+            username = self.player_names.get(color_int, f"Color{color_int}")
+            winner = player_info.get('winningPlayer', False)
+            vps = self._calc_victory_points(player_info.get('victoryPoints', {}))
+            results.append((username, vps, winner))
+        return results
+
+    def poll_stats(self):
+        return dict(self.poll_policy.stats(), lost=self.lost_transitions)
+
+    def _calculate_victory_points(self, game_state):
+        """
+        Return {username: vps}
+        """
+        output = {}
+        players = game_state.get('players', [])
+        for player in players:
+            username = player['userState'].get('username', "Unknown")
+            vp_dict = player['state'].get('victoryPointsState', {})
+            pts = self._calc_victory_points(vp_dict)
+            output[username] = pts
+        return output
+
+
+class LoopStorage:
+    """
+    Mixin for monitors that run on an asyncio event loop, so storing
+    states never blocks it: board upserts run on the loop's default executor,
+    and snapshots are dropped rather than waited on when the StateWriter is
+    full (the next one is then stored as a keyframe). Await
+    `_board_writes_done()` before reporting the game as ended.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.put_timeout = 0
+        self.board_writes = set()  # pending executor futures
+
+    def _write_board(self, key, board):
+        future = asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(super()._write_board, key, board)
+        )
+        self.board_writes.add(future)
+        future.add_done_callback(functools.partial(self._board_written, key))
+        return True  # assume it is stored; _board_written() undoes that if not
+
+    def _board_written(self, key, future):
+        self.board_writes.discard(future)
+        if (future.cancelled() or not future.result()) and self.stored_board is not None \
+                and self.stored_board[1] == key:
+            self.stored_board = None  # write it again with the next snapshot
+
+    async def _board_writes_done(self):
+        if self.board_writes:
+            await asyncio.wait(list(self.board_writes))
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+import time
+import queue
+import itertools
+import threading
+import traceback
+import multiprocessing
+
+from game_monitor import ColonistMonitor
+from monitor_base import MonitorEvents
+
+
+STATS_INTERVAL = 5  # seconds between poll stats reports from a worker
+
+
+class MonitorProxy(MonitorEvents):
+    """
+    Bot-side stand-in for a ColonistMonitor running in a worker process.
+
+    It offers the parts of the ColonistMonitor interface the bot uses; scores,
+    poll stats and final results arrive as events from the worker, so no game
+    state is ever decoded in the bot process.
+    """
+
+    def __init__(self, workers, key, interception=None):
+        super().__init__()
+        self.workers = workers
+        self.key = key
+        self.interception = interception
+        self.worker = None  # index of the hosting worker, chosen in start_driver()
+
+        self.monitoring = False
+        self.game_id = None
+        self.error = None
+        self.end_game_state = None
+        self.player_names = {}
+        self.scores = None
+        self.results = None
+        self.stats = {"interval": None, "avg_interval": None, "polls": 0,
+                      "changes": 0, "backoffs": 0, "throttled": 0, "lost": 0}
+
+        self.started = threading.Event()
+        self.start_error = None
+
+    def start_driver(self, timeout=300):
+        """Ask a worker to lease a browser tab; blocks until it answers."""
+        self.worker = self.workers.send_to_least_loaded(("start", self.key, self.interception))
+        if not self.started.wait(timeout):
+            # The lease may still succeed later; the worker then hands the tab straight back.
+            self.workers.cancel(self)
+            raise TimeoutError(f"Worker {self.worker} did not start a browser within {timeout}s")
+        if self.start_error:
+            raise RuntimeError(self.start_error)
+
+    def watch_game(self, game_id: str):
+        self.game_id = game_id
+        self.monitoring = True
+        self.workers.send(self.worker, ("watch", self.key, game_id))
+
+    def current_scores(self):
+        return self.scores
+
+    def final_results(self):
+        return self.results
+
+    def poll_stats(self):
+        return self.stats
+
+    def _handle(self, kind, data):
+        """Apply one event from the worker (called on the reader thread)."""
+        if kind == "started":
+            self.start_error = data
+            self.started.set()
+        elif kind == "state":
+            self.scores, self.player_names, self.stats = data
+            self._notify_state()
+        elif kind == "stats":
+            self.stats = data
+        elif kind == "done":
+            self.error = data["error"]
+            self.end_game_state = data["end_game_state"]
+            self.player_names = data["player_names"]
+            self.scores = data["scores"]
+            self.results = data["results"]
+            self.stats = data["stats"]
+            self.monitoring = False
+            self._finish()
+
+
+class MonitorWorkers:
+    """
+    Runs ColonistMonitors in `num_workers` separate processes so that decoding
+    game states and the selenium-wire proxies do not compete with the bot's
+    event loop for the GIL.
+
+    Each worker has its own MongoDB client, StateWriter, BrowserPool and share of
+    the poll budget, built from `config` (see `_worker_main`). Commands go to a
+    worker over its own queue; every worker reports back on one shared event
+    queue, which a reader thread dispatches to the matching MonitorProxy.
+    """
+
+    def __init__(self, num_workers, config):
+        # Forked, so the workers do not re-import the bot's main module.
+        self.ctx = multiprocessing.get_context("fork")
+        self.num_workers = num_workers
+        self.config = config
+        self.events = self.ctx.Queue()
+        self.commands = []
+        self.processes = []
+        self.proxies = {}  # key -> MonitorProxy
+        self.scheduler_stats = {}  # worker index -> latest PollScheduler.stats()
+        self.keys = itertools.count(1)
+        self.lock = threading.Lock()
+        self.reader = None
+        self.running = False
+
+    def start(self):
+        """
+        Fork the workers. Call this before the process creates a MongoClient or
+        starts other threads: a forked child inherits any lock a thread held at
+        that moment, and pymongo clients are not fork-safe.
+        """
+        if threading.active_count() > 1:
+            print(f"Warning: forking monitor workers while {threading.active_count() - 1} "
+                  f"other threads are running")
+        for index in range(self.num_workers):
+            commands = self.ctx.Queue()
+            process = self.ctx.Process(
+                target=_worker_main, args=(index, commands, self.events, self.config),
+                name=f"monitor-worker-{index}", daemon=True,
+            )
+            process.start()
+            self.commands.append(commands)
+            self.processes.append(process)
+        self.running = True
+        self.reader = threading.Thread(target=self._read_events, daemon=True)
+        self.reader.start()
+        print(f"Started {self.num_workers} monitor worker processes")
+
+    def monitor(self, interception=None):
+        """Create a MonitorProxy; call start_driver() and watch_game() on it like a ColonistMonitor."""
+        proxy = MonitorProxy(self, next(self.keys), interception)
+        with self.lock:
+            self.proxies[proxy.key] = proxy
+        return proxy
+
+    def cancel(self, proxy):
+        """Forget a proxy whose start timed out and have its worker release the tab if it gets one."""
+        with self.lock:
+            self.proxies.pop(proxy.key, None)
+        self.send(proxy.worker, ("cancel", proxy.key))
+
+    def send(self, index, command):
+        self.commands[index].put(command)
+
+    def send_to_least_loaded(self, command):
+        """Send a "start" command to the live worker hosting the fewest monitors; returns its index."""
+        with self.lock:
+            load = [0] * self.num_workers
+            for proxy in self.proxies.values():
+                if proxy.worker is not None and not proxy.finished:
+                    load[proxy.worker] += 1
+            alive = [i for i, process in enumerate(self.processes) if process.is_alive()]
+            if not alive:
+                raise RuntimeError("No monitor worker processes are running")
+            index = min(alive, key=lambda i: load[i])
+        self.send(index, command)
+        return index
+
+    def shutdown(self, timeout=30):
+        self.running = False
+        for commands in self.commands:
+            commands.put(("stop",))
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+    def _read_events(self):
+        last_check = time.time()
+        while self.running:
+            if time.time() - last_check >= 1:
+                self._check_workers()
+                last_check = time.time()
+            try:
+                kind, key, data = self.events.get(timeout=1)
+            except queue.Empty:
+                continue
+            except Exception as e:
+                print(f"Error reading monitor worker events: {e}")
+                continue
+            if kind == "scheduler":
+                self.scheduler_stats[key] = data
+                continue
+            with self.lock:
+                proxy = self.proxies.get(key)
+                if kind == "done" or (kind == "started" and data):
+                    self.proxies.pop(key, None)
+            if proxy is None:
+                continue
+            try:
+                proxy._handle(kind, data)
+            except Exception as e:
+                print(f"Error handling {kind} event for game {proxy.game_id}: {e}")
+                traceback.print_exc()
+
+    def _check_workers(self):
+        """Finish the monitors of any worker process that has died."""
+        for index, process in enumerate(self.processes):
+            if process.is_alive():
+                continue
+            with self.lock:
+                orphans = [p for p in self.proxies.values() if p.worker == index]
+                for proxy in orphans:
+                    self.proxies.pop(proxy.key, None)
+            for proxy in orphans:
+                print(f"Monitor worker {index} exited (code {process.exitcode}), ending game {proxy.game_id}")
+                if not proxy.started.is_set():
+                    proxy._handle("started", f"worker {index} exited")
+                proxy._handle("done", {
+                    "error": f"worker {index} exited", "end_game_state": None,
+                    "player_names": proxy.player_names, "scores": proxy.scores,
+                    "results": None, "stats": proxy.stats,
+                })
+
+
+def _worker_main(index, commands, events, config):
+    """
+    Body of a worker process. `config` holds "mongo_uri", "db_name",
+    "pool" (BrowserPool kwargs), "poll_budget" (polls per second for this worker),
+    "poll_workers" (PollScheduler threads), "writer" (StateWriter kwargs) and "monitor" (extra ColonistMonitor kwargs).
+    """
+    # Imported here so only the workers start these clients.
+    from pymongo import MongoClient
+    from browser_pool import BrowserPool
+    from polling import PollBudget, PollScheduler
+    from state_writer import StateWriter
+
+    db = MongoClient(config["mongo_uri"])[config["db_name"]]
+    writer = StateWriter(db, **config["writer"])
+    pool = BrowserPool(**config["pool"])
+    pool.start()
+    budget = PollBudget(max_polls_per_second=config["poll_budget"])
+    scheduler = PollScheduler(workers=config["poll_workers"])
+    scheduler.start()
+    monitors = {}  # key -> ColonistMonitor
+    cancelled = set()  # keys cancelled while their driver was still starting
+    lock = threading.Lock()
+
+    def release(key, monitor):
+        try:
+            monitor.driver.quit()
+        except Exception as e:
+            print(f"Worker {index} failed to release the tab of cancelled monitor {key}: {e}")
+
+    def start(key, interception):
+        monitor = ColonistMonitor(db, pool=pool, poll_budget=budget, interception=interception,
+                                  writer=writer, scheduler=scheduler, **config["monitor"])
+        try:
+            monitor.start_driver()
+        except Exception as e:
+            print(f"Worker {index} failed to start a driver: {e}")
+            traceback.print_exc()
+            with lock:
+                cancelled.discard(key)
+            events.put(("started", key, str(e) or type(e).__name__))
+            return
+        with lock:
+            was_cancelled = key in cancelled
+            cancelled.discard(key)
+            if not was_cancelled:
+                monitors[key] = monitor
+        if was_cancelled:
+            release(key, monitor)
+            return
+        events.put(("started", key, None))
+
+    def cancel(key):
+        with lock:
+            monitor = monitors.pop(key, None)
+            if monitor is None:
+                cancelled.add(key)
+        if monitor is not None:
+            release(key, monitor)
+
+    def on_state(key, monitor):
+        events.put(("state", key, (monitor.current_scores(), monitor.player_names, monitor.poll_stats())))
+
+    def on_done(key, monitor):
+        monitors.pop(key, None)
+        events.put(("done", key, {
+            "error": monitor.error,
+            "end_game_state": monitor.end_game_state,
+            "player_names": monitor.player_names,
+            "scores": monitor.current_scores(),
+            "results": monitor.final_results(),
+            "stats": monitor.poll_stats(),
+        }))
+
+    def report_stats():
+        while True:
+            events.put(("scheduler", index, scheduler.stats()))
+            for key, monitor in list(monitors.items()):
+                if monitor.monitoring:
+                    events.put(("stats", key, monitor.poll_stats()))
+            time.sleep(STATS_INTERVAL)
+
+    threading.Thread(target=report_stats, daemon=True).start()
+
+    try:
+        while True:
+            command = commands.get()
+            if command[0] == "stop":
+                break
+            if command[0] == "start":
+                _, key, interception = command
+                # Leasing can take a while; keep accepting commands meanwhile.
+                threading.Thread(target=start, args=(key, interception), daemon=True).start()
+            elif command[0] == "cancel":
+                cancel(command[1])
+            elif command[0] == "watch":
+                _, key, game_id = command
+                with lock:
+                    monitor = monitors[key]
+                monitor.add_state_listener(lambda m, key=key: on_state(key, m))
+                monitor.add_done_callback(lambda m, key=key: on_done(key, m))
+                monitor.watch_game(game_id)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.shutdown()
+        pool.shutdown()
+        writer.close()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+import time
+import heapq
+import itertools
+import threading
+import traceback
+
+
+class PollBudget:
+    """
+    A global cap on probes per second shared by every active monitor.
+
+    Each monitor reports the rate it would like to poll at; the budget is split
+    by water-filling, so quiet games that want less than a fair share leave the
+    remainder to busy ones.
+    """
+
+    def __init__(self, max_polls_per_second=100.0):
+        self.max_polls_per_second = max_polls_per_second
+        self.demand = {}  # key -> desired polls per second
+        self.lock = threading.Lock()
+
+    def allot(self, key, interval):
+        """Return the interval `key` may actually poll at, given it wants `interval`."""
+        with self.lock:
+            self.demand[key] = 1.0 / interval
+            share = self._fair_share()
+        return max(interval, 1.0 / share)
+
+    def release(self, key):
+        with self.lock:
+            self.demand.pop(key, None)
+
+    def active(self):
+        return len(self.demand)
+
+    def _fair_share(self):
+        remaining = self.max_polls_per_second
+        demands = sorted(self.demand.values())
+        for i, rate in enumerate(demands):
+            fair = remaining / (len(demands) - i)
+            if rate > fair:
+                return fair
+            remaining -= rate
+        return float("inf")
+
+
+class AdaptivePollPolicy:
+    """
+    Per-game polling interval: backs off exponentially while currentState is
+    unchanged and snaps back to `min_interval` as soon as it changes, never
+    exceeding the game's share of the optional PollBudget.
+    """
+
+    def __init__(self, budget=None, min_interval=0.05, max_interval=2.0, backoff=1.5):
+        self.budget = budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+
+        self.interval = min_interval  # what activity alone asks for
+        self.current = min_interval  # after applying the budget
+        self.polls = 0
+        self.changes = 0
+        self.backoffs = 0
+        self.throttled = 0  # polls slowed down by the global budget
+        self.total_interval = 0.0
+
+    def next_interval(self, changed):
+        """Record one poll and return how long to wait before the next one."""
+        self.polls += 1
+        if changed:
+            self.changes += 1
+            self.interval = self.min_interval
+        elif self.interval < self.max_interval:
+            self.backoffs += 1
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+
+        interval = self.interval
+        if self.budget is not None:
+            interval = self.budget.allot(id(self), self.interval)
+            if interval > self.interval:
+                self.throttled += 1
+        self.current = interval
+        self.total_interval += interval
+        return interval
+
+    def close(self):
+        """Stop counting this game against the budget."""
+        if self.budget is not None:
+            self.budget.release(id(self))
+
+    def stats(self):
+        return {
+            "interval": round(self.current, 3),
+            "avg_interval": round(self.total_interval / self.polls, 3) if self.polls else None,
+            "polls": self.polls,
+            "changes": self.changes,
+            "backoffs": self.backoffs,
+            "throttled": self.throttled,
+        }
+
+
+class PollScheduler:
+    """
+    Runs the polling of every monitor on a fixed pool of worker threads.
+
+    Tasks are kept in a heap ordered by when their next step is due. A task is
+    anything with a `step()` method returning the seconds until its next step,
+    or None once it is finished. Lag is how late a step started compared to
+    when it was due; a growing lag means more workers are needed.
+    """
+
+    def __init__(self, workers=4, late_threshold=0.1):
+        """
+        :param late_threshold: steps starting more than this many seconds late are counted as late
+        """
+        self.workers = workers
+        self.late_threshold = late_threshold
+        self.heap = []  # (due time, sequence, task)
+        self.sequence = itertools.count()
+        self.cond = threading.Condition()
+        self.threads = []
+        self.running = False
+        self.busy = 0
+        self.runs = 0
+        self.late = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+
+    def start(self):
+        with self.cond:
+            if self.running:
+                return
+            self.running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"poll-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def schedule(self, task, delay=0.0):
+        with self.cond:
+            heapq.heappush(self.heap, (time.monotonic() + delay, next(self.sequence), task))
+            self.cond.notify()
+
+    def shutdown(self, timeout=5):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def stats(self):
+        with self.cond:
+            return {
+                "workers": self.workers,
+                "busy": self.busy,
+                "scheduled": len(self.heap),
+                "runs": self.runs,
+                "late": self.late,
+                "avg_lag_ms": round(1000 * self.total_lag / self.runs, 1) if self.runs else None,
+                "max_lag_ms": round(1000 * self.max_lag, 1),
+            }
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running:
+                    now = time.monotonic()
+                    if self.heap and self.heap[0][0] <= now:
+                        break
+                    self.cond.wait(self.heap[0][0] - now if self.heap else None)
+                if not self.running:
+                    return
+                due, _, task = heapq.heappop(self.heap)
+                lag = now - due
+                self.runs += 1
+                self.total_lag += lag
+                self.max_lag = max(self.max_lag, lag)
+                if lag > self.late_threshold:
+                    self.late += 1
+                self.busy += 1
+
+            try:
+                delay = task.step()
+            except Exception as e:
+                print(f"Poll scheduler dropped a task after an error: {e}")
+                traceback.print_exc()
+                delay = None
+            finally:
+                with self.cond:
+                    self.busy -= 1
+
+            if delay is not None:
+                self.schedule(task, delay)
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+import sys
+import json
+import base64
+import time
+import asyncio
+import traceback
+
+import aiohttp
+from aiohttp import web
+
+from colonist_protocol import (
+    GameModel, ProtocolError, decode_frame, capture_record, read_capture, replay, summarize,
+)
+from monitor_base import MonitorBase, LoopStorage, Probe
+
+
+def _fill(template, game_id):
+    """Substitute {game_id} in a join message template (a JSON-compatible value)."""
+    if isinstance(template, str):
+        return template.replace("{game_id}", game_id)
+    if isinstance(template, dict):
+        return {k: _fill(v, game_id) for k, v in template.items()}
+    if isinstance(template, list):
+        return [_fill(v, game_id) for v in template]
+    return template
+
+
+class SpectatorObserver(LoopStorage, MonitorBase):
+    """
+    Follows a game over Colonist's websocket without a browser.
+
+    It connects to `url_template`, sends `join_messages` (both may contain
+    {game_id}), and rebuilds the game state from the server's messages with a
+    colonist_protocol.GameModel. Transitions go through the same state_log,
+    storage and listener paths as the browser monitors, so the bot can use it
+    like an AsyncColonistMonitor. Every frame in both directions can be written
+    to `capture_path` to build replayable captures.
+    """
+
+    def __init__(self, url_template, join_messages=(), db=None, writer=None,
+                 keyframe_interval=None, split_board=False, capture_path=None):
+        super().__init__(db, writer=writer, keyframe_interval=keyframe_interval, split_board=split_board)
+        self.url_template = url_template
+        self.join_messages = list(join_messages)
+        self.capture_path = capture_path
+        self.model = GameModel()
+        self.http = None
+        self.ws = None
+        self.capture = None
+        self.task = None
+
+    async def start_driver(self):
+        """Nothing to start: the connection is made per game in watch_game()."""
+        self.http = aiohttp.ClientSession()
+
+    def watch_game(self, game_id: str):
+        """Start following a game in a task on the running event loop."""
+        if self.monitoring:
+            print("Already monitoring a game.")
+            return
+
+        self.game_id = game_id
+        self.monitoring = True
+        self.task = asyncio.get_running_loop().create_task(self._observe())
+
+    async def _observe(self):
+        try:
+            if self.capture_path:
+                self.capture = open(self.capture_path, "a")
+            url = _fill(self.url_template, self.game_id)
+            print(f"Observing game {self.game_id} at {url}")
+            self.ws = await self.http.ws_connect(url, max_msg_size=0)
+            for message in _fill(self.join_messages, self.game_id):
+                text = message if isinstance(message, str) else json.dumps(message)
+                self._record_frame(text, "out")
+                await self.ws.send_str(text)
+
+            self.latest_update_time = time.time()
+            while True:
+                remaining = self.max_wait_seconds - (time.time() - self.latest_update_time)
+                try:
+                    frame = await asyncio.wait_for(self.ws.receive(), max(remaining, 0))
+                except asyncio.TimeoutError:
+                    print(json.dumps({"error": "Timed out waiting for game to end."}))
+                    self.error = 'stalled'
+                    break
+                if frame.type not in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                    self.error = self.error or 'disconnected'
+                    break
+                self._record_frame(frame.data, "in")
+                if self._handle_frame(frame.data):
+                    break
+
+        except Exception as exc:
+            print(json.dumps({"error": str(exc)}))
+            traceback.print_exc()
+            self.error = str(exc)
+        finally:
+            try:
+                if self.ws is not None:
+                    await self.ws.close()
+                if self.http is not None:
+                    await self.http.close()
+                if self.capture is not None:
+                    self.capture.close()
+                await self._board_writes_done()
+                if self.writer is not None:
+                    await asyncio.get_running_loop().run_in_executor(None, self.writer.flush)
+            finally:
+                self.monitoring = False
+                self._finish()
+
+    def _handle_frame(self, data, t=None):
+        """Apply one incoming frame; returns True once the game is over."""
+        try:
+            message = decode_frame(data)
+        except ProtocolError as e:
+            print(f"Game {self.game_id}: {e}")
+            return False
+        kind = self.model.apply(message)
+        if kind is None:
+            return False
+
+        self.game_state = self.model.game_state
+        probe = Probe(self.model.current_state, None, self.model.is_game_over,
+                      self.model.end_game_state, None,
+                      [{"state": self.model.current_state, "t": (t or time.time()) * 1000}])
+        if self.game_state is not None:
+            if not self.state_log:
+                self._record_initial(probe)
+            else:
+                self._record_probe(probe)
+
+        if probe.is_game_over:
+            self.end_game_state = probe.end_game_state
+            self._store_game_state("END", self.end_game_state, is_final=True)
+            return True
+        return False
+
+    def _record_frame(self, data, direction):
+        if self.capture is not None:
+            self.capture.write(json.dumps(capture_record(data, time.time(), direction)) + "\n")
+            self.capture.flush()
+
+
+async def start_capture_server(path, host="127.0.0.1", port=8765, speed=1.0):
+    """
+    Local stand-in for Colonist's websocket server: every client that connects
+    is sent the incoming frames of a capture with their original spacing
+    (divided by `speed`, 0 sends them at once), then the connection is closed.
+    Returns the aiohttp AppRunner; call its cleanup() to stop serving.
+    """
+    records = [r for r in read_capture(path) if r.get("dir", "in") == "in"]
+
+    async def handler(request):
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        previous = None
+        for record in records:
+            if previous is not None and speed > 0:
+                await asyncio.sleep(max(record["t"] - previous, 0) / speed)
+            previous = record["t"]
+            if record.get("binary"):
+                await ws.send_bytes(base64.b64decode(record["data"]))
+            else:
+                await ws.send_str(record["data"])
+        await ws.close()
+        return ws
+
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Serving {len(records)} frames from {path} on ws://{host}:{port}/")
+    return runner
+
+
+async def serve_capture(path, host="127.0.0.1", port=8765, speed=1.0):
+    """Serve a capture with start_capture_server() until cancelled."""
+    runner = await start_capture_server(path, host, port, speed)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def _replay_command(path):
+    model = GameModel()
+    for record, kind in replay(read_capture(path), model):
+        if kind is not None:
+            print(f"{record.get('t')}: {kind}, currentState={json.dumps(model.current_state)}")
+    print(f"{model.messages} messages, {model.ignored} ignored, by kind: {model.kinds}")
+    if model.end_game_state:
+        print("endGameState:", json.dumps(model.end_game_state)[:500])
+
+
+async def _watch_command(url, game_id, capture_path=None):
+    observer = SpectatorObserver(url, capture_path=capture_path)
+    await observer.start_driver()
+    observer.watch_game(game_id)
+    await observer.completion_future(asyncio.get_running_loop())
+    results = observer.final_results()
+    if results:
+        print("Final results:", {name: vps for name, vps, _ in results})
+    else:
+        print(f"No final results ({observer.error}).")
+
+
+def main():
+    usage = ("Usage: python spectator.py replay <capture> | summarize <capture> | "
+             "serve <capture> [port] [speed] | watch <wsUrl> <gameId> [captureOut]")
+    if len(sys.argv) < 3:
+        print(usage)
+        sys.exit(1)
+
+    command, args = sys.argv[1], sys.argv[2:]
+    if command == "replay":
+        _replay_command(args[0])
+    elif command == "summarize":
+        for shape, count in sorted(summarize(read_capture(args[0])).items(), key=lambda item: -item[1]):
+            print(f"{count:6d}  {shape}")
+    elif command == "serve":
+        port = int(args[1]) if len(args) > 1 else 8765
+        speed = float(args[2]) if len(args) > 2 else 1.0
+        asyncio.run(serve_capture(args[0], port=port, speed=speed))
+    elif command == "watch" and len(args) >= 2:
+        asyncio.run(_watch_command(args[0], args[1], args[2] if len(args) > 2 else None))
+    else:
+        print(usage)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
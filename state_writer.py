@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+import time
+import threading
+import traceback
+from collections import deque
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+
+class StateWriter:
+    """
+    Write-behind buffer for game state documents, shared by all monitors.
+
+    Monitors `put()` documents and return immediately; a background thread
+    writes them with unordered `insert_many` once `batch_size` documents are
+    queued or `flush_interval` seconds have passed. The buffer holds at most
+    `max_buffer` documents: when it is full `put()` blocks for up to
+    `put_timeout` seconds and then drops the document, and both are counted
+    in `stats`.
+    """
+
+    def __init__(self, db, collection="game_states", batch_size=100, flush_interval=1.0,
+                 max_buffer=5000, put_timeout=5.0, write_concern=None):
+        """
+        :param write_concern: Optional pymongo WriteConcern for the inserts
+        """
+        self.collection = db[collection]
+        if write_concern is not None:
+            self.collection = self.collection.with_options(write_concern=write_concern)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.put_timeout = put_timeout
+
+        self.buffer = deque()
+        self.cond = threading.Condition()
+        self.queued = 0  # documents accepted so far
+        self.done = 0  # documents written (or permanently failed) so far
+        self.flush_requested = False
+        self.closed = False
+        self.stats = {
+            "written": 0,
+            "batches": 0,
+            "failed": 0,
+            "retried_batches": 0,
+            "dropped": 0,
+            "blocked_puts": 0,
+            "blocked_seconds": 0.0,
+            "max_depth": 0,
+        }
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def put(self, doc, timeout=None):
+        """
+        Queue a document; returns False if it had to be dropped. `timeout`
+        overrides `put_timeout`; 0 never blocks, for callers on an event loop.
+        """
+        if timeout is None:
+            timeout = self.put_timeout
+        with self.cond:
+            if len(self.buffer) >= self.max_buffer:
+                if timeout > 0:
+                    self.stats["blocked_puts"] += 1
+                    start = time.time()
+                    self.cond.wait_for(lambda: len(self.buffer) < self.max_buffer or self.closed,
+                                       timeout=timeout)
+                    self.stats["blocked_seconds"] += time.time() - start
+                if len(self.buffer) >= self.max_buffer:
+                    self.stats["dropped"] += 1
+                    print(f"State writer buffer full, dropped a document for game {doc.get('game_id')}")
+                    return False
+
+            self.buffer.append(doc)
+            self.queued += 1
+            self.stats["max_depth"] = max(self.stats["max_depth"], len(self.buffer))
+            if len(self.buffer) >= self.batch_size:
+                self.cond.notify_all()
+            return True
+
+    def flush(self, timeout=30):
+        """Block until everything queued before this call has been written."""
+        with self.cond:
+            target = self.queued
+            self.flush_requested = True
+            self.cond.notify_all()
+            return self.cond.wait_for(lambda: self.done >= target, timeout=timeout)
+
+    def close(self, timeout=30):
+        """Flush the buffer and stop the writer thread."""
+        self.flush(timeout)
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join(timeout)
+
+    def depth(self):
+        return len(self.buffer)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(
+                    lambda: len(self.buffer) >= self.batch_size or self.flush_requested or self.closed,
+                    timeout=self.flush_interval,
+                )
+                if self.closed and not self.buffer:
+                    return
+                batch = [self.buffer.popleft() for _ in range(min(self.batch_size, len(self.buffer)))]
+                if not self.buffer:
+                    self.flush_requested = False
+                # Room was freed for producers blocked in put().
+                self.cond.notify_all()
+
+            if batch and not self._write(batch):
+                with self.cond:
+                    self.buffer.extendleft(reversed(batch))
+                time.sleep(1)  # back off before retrying
+
+    def _write(self, batch):
+        """Insert one batch; returns False if it should be retried."""
+        try:
+            failed = self._insert(batch)
+        except PyMongoError as e:
+            print(f"State writer failed to insert {len(batch)} documents, will retry: {e}")
+            traceback.print_exc()
+            self.stats["retried_batches"] += 1
+            return False
+
+        with self.cond:
+            self.stats["batches"] += 1
+            self.stats["written"] += len(batch) - failed
+            self.stats["failed"] += failed
+            self.done += len(batch)
+            self.cond.notify_all()
+        return True
+
+    def _insert(self, batch):
+        """
+        Insert documents and return how many were rejected for good. Raises
+        PyMongoError for failures worth retrying.
+        """
+        try:
+            self.collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Some documents were rejected (they would be rejected again); the rest are stored.
+            failed = len(e.details.get("writeErrors", []))
+            print(f"State writer: {failed} of {len(batch)} documents rejected")
+            return failed
+        except PyMongoError:
+            raise
+        except Exception as e:
+            # Typically bson's InvalidDocument or DocumentTooLarge, raised while
+            # encoding: split the batch to store everything but the bad documents.
+            if len(batch) == 1:
+                print(f"State writer: rejected a document for game {batch[0].get('game_id')}: {e}")
+                return 1
+            middle = len(batch) // 2
+            return self._insert(batch[:middle]) + self._insert(batch[middle:])
+        return 0
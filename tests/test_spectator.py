@@ -0,0 +1,107 @@
+import os
+import json
+import socket
+import asyncio
+
+import pytest
+
+import spectator
+from colonist_protocol import (
+    GameModel, ProtocolError, classify, decode_frame, merge_diff, read_capture, replay, summarize,
+)
+
+
+# Synthetic: hand-written in the message format colonist_protocol assumes, not recorded from a real game.
+CAPTURE = os.path.join(os.path.dirname(__file__), "captures", "sample_game.jsonl")
+
+
+def test_classify_finds_payload_at_every_known_path():
+    assert classify({"data": {"payload": {"gameState": {"a": 1}}}}) == ("snapshot", {"a": 1})
+    assert classify({"data": {"diff": {"a": 2}}}) == ("diff", {"a": 2})
+    assert classify({"payload": {"endGameState": {"players": {}}}}) == ("end", {"players": {}})
+    assert classify({"gameState": {"a": 3}}) == ("snapshot", {"a": 3})
+
+
+def test_classify_ignores_other_messages():
+    assert classify({"type": "ping"}) == (None, None)
+    assert classify(["not", "a", "dict"]) == (None, None)
+
+
+def test_merge_diff_merges_deletes_and_leaves_the_original_alone():
+    state = {"currentState": {"turnState": 1, "actionState": 0}, "bank": {"resources": 19}}
+    merged = merge_diff(state, {"currentState": {"turnState": 2}, "bank": None, "dice": [3, 4]})
+    assert merged == {"currentState": {"turnState": 2, "actionState": 0}, "dice": [3, 4]}
+    assert state == {"currentState": {"turnState": 1, "actionState": 0}, "bank": {"resources": 19}}
+
+
+def test_decode_frame_rejects_invalid_json():
+    with pytest.raises(ProtocolError):
+        decode_frame("{not json")
+
+
+def test_decode_frame_msgpack():
+    msgpack = pytest.importorskip("msgpack")
+    message = {"data": {"diff": {1: "non-string key"}}}
+    assert decode_frame(msgpack.packb(message)) == message
+
+
+def test_replay_rebuilds_the_captured_game():
+    model = GameModel()
+    kinds = [kind for _, kind in replay(read_capture(CAPTURE), model)]
+
+    assert kinds == [None, None, "snapshot", "diff", "diff", "end"]
+    assert model.messages == 6
+    assert model.ignored == 2
+    assert model.kinds == {"snapshot": 1, "diff": 2, "end": 1}
+    assert model.current_state == {"completedTurns": 1, "turnState": 1, "actionState": 0}
+    assert "bank" not in model.game_state
+    assert model.is_game_over
+    assert model.end_game_state["players"]["1"]["winningPlayer"] is True
+
+
+def test_summarize_counts_message_shapes():
+    shapes = summarize(read_capture(CAPTURE))
+    assert sum(shapes.values()) == 6
+    assert shapes["data / diff"] == 2
+    assert shapes["data / gameState"] == 1
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_observer_follows_a_served_capture():
+    port = _free_port()
+
+    async def run():
+        runner = await spectator.start_capture_server(CAPTURE, port=port, speed=0)
+        try:
+            observer = spectator.SpectatorObserver(
+                f"ws://127.0.0.1:{port}/{{game_id}}", [{"action": "join", "gameId": "{game_id}"}],
+            )
+            await observer.start_driver()
+            observer.watch_game("abc123")
+            await asyncio.wait_for(observer.completion_future(asyncio.get_running_loop()), 10)
+            return observer
+        finally:
+            await runner.cleanup()
+
+    observer = asyncio.run(run())
+
+    assert observer.error is None
+    assert [state for state, _ in observer.state_log] == [
+        {"completedTurns": 0, "turnState": 1, "actionState": 0},
+        {"completedTurns": 0, "turnState": 2, "actionState": 0},
+        {"completedTurns": 1, "turnState": 1, "actionState": 0},
+    ]
+    assert observer.current_scores() == {"alice": 2, "bob": 2}
+    assert sorted(observer.final_results()) == [("alice", 10, True), ("bob", 6, False)]
+
+
+def test_capture_records_are_json_lines():
+    with open(CAPTURE) as f:
+        for line in f:
+            record = json.loads(line)
+            assert set(record) == {"t", "dir", "binary", "data"}